@@ -1,4 +1,5 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
 from .models import CashDay, SaleEvent
 
 
@@ -12,7 +13,7 @@ class CashDayAdmin(admin.ModelAdmin):
 
     fieldsets = (
         ('Основная информация', {
-            'fields': ('date', 'is_closed')
+            'fields': ('date', 'is_closed', 'closed_at')
         }),
         ('Наличные расчеты', {
             'fields': ('cash_sales_total', 'cash_sales_count')
@@ -25,7 +26,29 @@ class CashDayAdmin(admin.ModelAdmin):
         }),
     )
 
-    readonly_fields = ('total_sales',)
+    readonly_fields = ('total_sales', 'is_closed', 'closed_at')
+    closed_readonly_fields = ('date', 'cash_sales_total', 'cash_sales_count', 'card_sales_total', 'card_sales_count')
+    actions = ('close_days',)
+
+    def get_readonly_fields(self, request, obj=None):
+        """Итоги закрытого дня заморожены"""
+        if obj is not None and obj.is_closed:
+            return self.readonly_fields + self.closed_readonly_fields
+        return self.readonly_fields
+
+    @admin.action(description='Закрыть выбранные дни')
+    def close_days(self, request, queryset):
+        for cash_day in queryset.filter(is_closed=False):
+            try:
+                drift = cash_day.close()
+            except ValidationError as e:
+                self.message_user(request, f'{cash_day}: {"; ".join(e.messages)}', messages.ERROR)
+                continue
+            if drift:
+                fixed = ', '.join(f'{name}: {old} -> {new}' for name, (old, new) in drift.items())
+                self.message_user(request, f'{cash_day}: исправлены расхождения ({fixed})', messages.WARNING)
+            else:
+                self.message_user(request, f'{cash_day}: закрыт без расхождений')
 
 
 @admin.register(SaleEvent)
@@ -47,6 +70,15 @@ class SaleEventAdmin(admin.ModelAdmin):
 
     readonly_fields = ('timestamp',)
 
+    def has_delete_permission(self, request, obj=None):
+        """
+        События закрытого дня не удаляются: ни со страницы события, ни
+        действием delete_selected (оно проверяет права на каждый объект)
+        """
+        if obj is not None and obj.cash_day.is_closed:
+            return False
+        return super().has_delete_permission(request, obj)
+
     def event_type_display(self, obj):
         return obj.get_event_type_display()
 
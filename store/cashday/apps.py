@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class CashdayConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'cashday'
\ No newline at end of file
+    name = 'cashday'
+
+    def ready(self):
+        from . import signals  # noqa: F401
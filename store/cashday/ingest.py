@@ -0,0 +1,149 @@
+# cashday/ingest.py
+"""
+Пакетная загрузка событий с касс, которые работали офлайн.
+
+События вставляются одним bulk_create, а итоги каждого затронутого дня
+меняются одним UPDATE на тип оплаты. Повторная выгрузка того же пакета
+безопасна: события с уже известным client_event_id пропускаются.
+Если параллельная выгрузка за другой день успела записать то же событие
+между проверкой и вставкой, пакет вставляется по одному событию, и такие
+события попадают в дубли.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import CashDay, SaleEvent
+
+MAX_BATCH_SIZE = 5000
+
+
+def _build_event(data):
+    """Словарь с кассы -> несохраненный SaleEvent (день пока задан датой)"""
+    if not isinstance(data, dict):
+        raise ValidationError('ожидался объект')
+    client_event_id = str(data.get('client_event_id') or '').strip()
+    if not client_event_id:
+        raise ValidationError('не указан client_event_id')
+    try:
+        day = date.fromisoformat(str(data['date']))
+    except (KeyError, ValueError):
+        raise ValidationError('date должна быть в формате YYYY-MM-DD')
+
+    event = SaleEvent(
+        client_event_id=client_event_id,
+        event_type=data.get('event_type'),
+        payment_type=data.get('payment_type', 'none'),
+        amount=Decimal(str(data.get('amount', 0))),
+        notes=data.get('notes'),
+    )
+    if data.get('timestamp'):
+        event.timestamp = data['timestamp']
+    event.clean_fields(exclude=['cash_day'])
+    return day, event
+
+
+def _known_ids(client_event_ids):
+    """client_event_id из списка, уже записанные в БД"""
+    return set(
+        SaleEvent.objects.filter(client_event_id__in=client_event_ids)
+        .values_list('client_event_id', flat=True)
+    )
+
+
+def _insert_events(events):
+    """
+    Вставляет события одним bulk_create. При конфликте client_event_id
+    (событие записано параллельной выгрузкой) - по одному, каждое в своей
+    точке сохранения. Возвращает (вставленные, client_event_id дублей).
+    """
+    try:
+        with transaction.atomic():
+            SaleEvent.objects.bulk_create(events)
+        return events, []
+    except IntegrityError:
+        pass
+    inserted, duplicates = [], []
+    for event in events:
+        try:
+            with transaction.atomic():
+                SaleEvent.objects.bulk_create([event])
+        except IntegrityError:
+            event.pk = None
+            duplicates.append(event.client_event_id)
+        else:
+            inserted.append(event)
+    return inserted, duplicates
+
+
+def ingest_sale_events(payload):
+    """
+    Загружает список событий. Возвращает словарь с числом принятых событий,
+    client_event_id дублей и ошибками по отдельным событиям.
+    """
+    errors = []
+    parsed = {}  # client_event_id -> (индекс, дата, SaleEvent); повтор внутри пакета - дубль
+    duplicates = []
+
+    for index, data in enumerate(payload):
+        try:
+            day, event = _build_event(data)
+        except (ValidationError, ArithmeticError, TypeError) as e:
+            message = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+            errors.append({
+                'index': index,
+                'client_event_id': data.get('client_event_id') if isinstance(data, dict) else None,
+                'error': message,
+            })
+            continue
+        if event.client_event_id in parsed:
+            duplicates.append(event.client_event_id)
+        else:
+            parsed[event.client_event_id] = (index, day, event)
+
+    if not parsed:
+        return {'accepted': 0, 'duplicates': duplicates, 'errors': errors}
+
+    with transaction.atomic():
+        dates = {day for _, day, _ in parsed.values()}
+        CashDay.objects.bulk_create([CashDay(date=d) for d in dates], ignore_conflicts=True)
+        # Блокировка дней сериализует параллельные выгрузки одних и тех же событий
+        days = {}
+        closed = set()
+        for day in CashDay.objects.select_for_update().filter(date__in=dates).order_by('pk'):
+            days[day.date] = day.pk
+            if day.is_closed:
+                closed.add(day.date)
+
+        known = _known_ids(list(parsed))
+        duplicates.extend(known)
+
+        new_events = []
+        for client_event_id, (index, day, event) in parsed.items():
+            if client_event_id in known:
+                continue
+            if day in closed:
+                errors.append({
+                    'index': index,
+                    'client_event_id': client_event_id,
+                    'error': f'торговый день {day} закрыт',
+                })
+                continue
+            event.cash_day_id = days[day]
+            new_events.append(event)
+
+        new_events, raced = _insert_events(new_events)
+        duplicates.extend(raced)
+
+        deltas = defaultdict(lambda: [Decimal(0), 0])  # (день, тип оплаты) -> [сумма, количество]
+        for event in new_events:
+            if event.event_type == 'sale' and event.payment_type in ('cash', 'card'):
+                delta = deltas[event.cash_day_id, event.payment_type]
+                delta[0] += event.amount
+                delta[1] += 1
+        SaleEvent.apply_deltas(deltas)
+
+    return {'accepted': len(new_events), 'duplicates': duplicates, 'errors': errors}
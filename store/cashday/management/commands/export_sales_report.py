@@ -0,0 +1,62 @@
+import csv
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cashday import reports
+
+
+class Command(BaseCommand):
+    help = 'Export a sales report (revenue, events or heatmap) to CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'report',
+            choices=sorted(reports.REPORTS),
+            help='Report to export'
+        )
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help='First cash day, YYYY-MM-DD (default: 30 days before --end)'
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last cash day, YYYY-MM-DD (default: today)'
+        )
+        parser.add_argument(
+            '--period',
+            choices=reports.PERIODS,
+            default='day',
+            help='Grouping for the revenue report (default: day)'
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='Output CSV file (default: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start'] or end - timedelta(days=29)
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        kwargs = {'period': options['period']} if options['report'] == 'revenue' else {}
+        rows = reports.REPORTS[options['report']](start, end, **kwargs)
+
+        if options['output'] == '-':
+            self.write_csv(self.stdout, rows)
+        else:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                self.write_csv(f, rows)
+            self.stdout.write(self.style.SUCCESS(f'Saved {len(rows)} rows to {options["output"]}'))
+
+    def write_csv(self, stream, rows):
+        if not rows:
+            return
+        writer = csv.DictWriter(stream, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
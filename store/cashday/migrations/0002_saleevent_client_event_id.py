@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashday', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleevent',
+            name='client_event_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Идентификатор события на кассе'),
+        ),
+        migrations.AlterField(
+            model_name='saleevent',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время события'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashday', '0002_saleevent_client_event_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashday',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время закрытия'),
+        ),
+        migrations.AddField(
+            model_name='cashday',
+            name='snapshot',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Итоги на момент закрытия'),
+        ),
+    ]
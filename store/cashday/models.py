@@ -1,4 +1,11 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
 
 class CashDay(models.Model):
     date = models.DateField(verbose_name="Дата", unique=True)
@@ -23,15 +30,103 @@ class CashDay(models.Model):
     is_closed = models.BooleanField(
         default=False, verbose_name="День закрыт"
     )
+    closed_at = models.DateTimeField(
+        blank=True, null=True, verbose_name="Время закрытия"
+    )
+    snapshot = models.JSONField(
+        blank=True, null=True, encoder=DjangoJSONEncoder,
+        verbose_name="Итоги на момент закрытия"
+    )
 
     def __str__(self):
         return f"Торговый день: {self.date.strftime('%d.%m.%Y')}"
 
+    @classmethod
+    def add_sales(cls, pk, payment_type, amount, count=1):
+        """
+        Атомарно прибавляет продажи к итогам дня одним UPDATE с F()-выражениями,
+        без чтения строки: параллельные кассы не теряют обновления.
+        Отрицательные amount / count вычитают продажи (правка, удаление).
+        Закрытый день не меняется; возвращает число обновленных строк (0 или 1).
+        """
+        if payment_type not in ('cash', 'card'):
+            return 0
+        return cls.objects.filter(pk=pk, is_closed=False).update(**{
+            f'{payment_type}_sales_total': F(f'{payment_type}_sales_total') + amount,
+            f'{payment_type}_sales_count': F(f'{payment_type}_sales_count') + count,
+            'total_sales': F('total_sales') + amount,
+        })
+
+    @classmethod
+    def check_open(cls, *pks):
+        """ValidationError, если среди дней pks есть закрытый"""
+        if cls.objects.filter(pk__in=pks, is_closed=True).exists():
+            raise ValidationError('Торговый день закрыт, изменение событий запрещено')
+
     def update_totals(self):
         """Обновление итоговых значений при закрытии дня"""
         self.total_sales = self.cash_sales_total + self.card_sales_total
         self.save()
 
+    def close(self):
+        """
+        Закрытие дня: итоги пересчитываются по событиям одним агрегирующим
+        запросом, расхождения со счетчиками исправляются, день замораживается
+        и сохраняет снимок итогов для отчетов.
+        Возвращает расхождения {поле: (было, стало)}.
+        """
+        with transaction.atomic():
+            day = CashDay.objects.select_for_update().get(pk=self.pk)
+            if day.is_closed:
+                raise ValidationError('Торговый день уже закрыт')
+
+            rows = list(
+                SaleEvent.objects.filter(cash_day=day)
+                .values('event_type', 'payment_type')
+                .annotate(count=Count('pk'), total=Sum('amount'))
+                .order_by('event_type', 'payment_type')
+            )
+
+            totals = {
+                'cash_sales_total': Decimal(0),
+                'cash_sales_count': 0,
+                'card_sales_total': Decimal(0),
+                'card_sales_count': 0,
+            }
+            returns_total = Decimal(0)
+            for row in rows:
+                if row['event_type'] == 'sale' and row['payment_type'] in ('cash', 'card'):
+                    totals[f"{row['payment_type']}_sales_total"] += row['total']
+                    totals[f"{row['payment_type']}_sales_count"] += row['count']
+                elif row['event_type'] == 'return':
+                    returns_total += row['total']
+            totals['total_sales'] = totals['cash_sales_total'] + totals['card_sales_total']
+
+            drift = {
+                name: (getattr(day, name), value)
+                for name, value in totals.items()
+                if getattr(day, name) != value
+            }
+
+            sales_count = totals['cash_sales_count'] + totals['card_sales_count']
+            for name, value in totals.items():
+                setattr(day, name, value)
+            day.is_closed = True
+            day.closed_at = timezone.now()
+            day.snapshot = {
+                'revenue': totals['total_sales'],
+                'sales_count': sales_count,
+                'average_ticket': totals['total_sales'] / sales_count if sales_count else None,
+                'returns_total': returns_total,
+                'events_count': sum(row['count'] for row in rows),
+                'events': rows,
+            }
+            day.save()
+
+        for name in (*totals, 'is_closed', 'closed_at', 'snapshot'):
+            setattr(self, name, getattr(day, name))
+        return drift
+
     class Meta:
         verbose_name = "Торговый день"
         verbose_name_plural = "Торговые дни"
@@ -68,27 +163,120 @@ class SaleEvent(models.Model):
         max_digits=10, decimal_places=2,
         default=0, verbose_name="Сумма"
     )
+    # Время события задает касса (офлайн-выгрузка), поэтому поле не auto_now_add
+    # и, в отличие от прежнего, редактируется в админке
     timestamp = models.DateTimeField(
-        auto_now_add=True, verbose_name="Время события"
+        default=timezone.now, verbose_name="Время события"
     )
     notes = models.TextField(
         blank=True, null=True, verbose_name="Комментарий"
     )
+    client_event_id = models.CharField(
+        max_length=64, unique=True, blank=True, null=True,
+        verbose_name="Идентификатор события на кассе"
+    )
+
+    # Поля, от которых зависит вклад события в итоги дня
+    TRACKED_FIELDS = ('cash_day_id', 'event_type', 'payment_type', 'amount')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # При .only()/.defer() не дочитываем поля - сохраненная версия прочитается при save
+        if all(name in field_names for name in cls.TRACKED_FIELDS):
+            instance._remember_state()
+        return instance
+
+    def _current_state(self):
+        return tuple(getattr(self, name) for name in self.TRACKED_FIELDS)
+
+    def _remember_state(self, state=None):
+        self._saved_state = self._current_state() if state is None else state
+
+    def _written_state(self, previous, update_fields):
+        """
+        Значения TRACKED_FIELDS после save: поля вне update_fields
+        в БД не записываются и остаются из сохраненной версии
+        """
+        current = self._current_state()
+        if update_fields is None or previous is None:
+            return current
+        updated = set(update_fields)
+        return tuple(
+            value if name in updated or name.removesuffix('_id') in updated else old
+            for name, value, old in zip(self.TRACKED_FIELDS, current, previous)
+        )
+
+    def _previous_state(self):
+        """Значения TRACKED_FIELDS сохраненной версии события (до текущих изменений)"""
+        if self._state.adding:
+            return None
+        if hasattr(self, '_saved_state'):
+            return self._saved_state
+        # Экземпляр создан вручную с pk - читаем сохраненную версию
+        return SaleEvent.objects.filter(pk=self.pk).values_list(*self.TRACKED_FIELDS).first()
+
+    @staticmethod
+    def contribution(state):
+        """Вклад события в итоги дня: (cash_day_id, тип оплаты, сумма) или None"""
+        if state is None:
+            return None
+        cash_day_id, event_type, payment_type, amount = state
+        if event_type == 'sale' and payment_type in ('cash', 'card'):
+            return cash_day_id, payment_type, amount
+        return None
+
+    @staticmethod
+    def apply_deltas(deltas, touched_days=()):
+        """
+        Применяет {(cash_day_id, тип оплаты): (сумма, количество)} к итогам дней
+        атомарными UPDATE. Закрытые дни (в т.ч. из touched_days) - ValidationError.
+        """
+        checked = set()
+        for (cash_day_id, payment_type), (amount, count) in deltas.items():
+            if not amount and not count:
+                continue
+            # UPDATE не затрагивает закрытый день - тогда откатываем всю операцию
+            if not CashDay.add_sales(cash_day_id, payment_type, amount, count=count):
+                CashDay.check_open(cash_day_id)
+            checked.add(cash_day_id)
+        for cash_day_id in set(touched_days) - checked:
+            CashDay.check_open(cash_day_id)
+
+    def clean(self):
+        """События закрытого дня не добавляются, не меняются и не переносятся"""
+        super().clean()
+        previous = self._previous_state()
+        days = {self.cash_day_id, previous[0] if previous else None} - {None}
+        if days:
+            CashDay.check_open(*days)
 
     def save(self, *args, **kwargs):
-        """Автоматическое обновление статистики дня при сохранении"""
-        super().save(*args, **kwargs)
-
-        if self.event_type == 'sale' and self.payment_type in ['cash', 'card']:
-            cash_day = self.cash_day
-            if self.payment_type == 'cash':
-                cash_day.cash_sales_total += self.amount
-                cash_day.cash_sales_count += 1
-            elif self.payment_type == 'card':
-                cash_day.card_sales_total += self.amount
-                cash_day.card_sales_count += 1
-
-            cash_day.update_totals()
+        """
+        Автоматическое обновление статистики дня при сохранении.
+        К итогам применяется только разница между сохраненной и новой версией
+        события (атомарным UPDATE в той же транзакции); загруженный ранее
+        self.cash_day при этом не обновляется. При update_fields учитываются
+        только записанные поля.
+        В закрытый день события не записываются (ValidationError).
+        """
+        with transaction.atomic():
+            previous = self._previous_state()
+            super().save(*args, **kwargs)
+            current = self._written_state(previous, kwargs.get('update_fields'))
+
+            deltas = defaultdict(lambda: [Decimal(0), 0])
+            old, new = self.contribution(previous), self.contribution(current)
+            if old:
+                deltas[old[0], old[1]][0] -= old[2]
+                deltas[old[0], old[1]][1] -= 1
+            if new:
+                deltas[new[0], new[1]][0] += new[2]
+                deltas[new[0], new[1]][1] += 1
+            touched = {current[0], previous[0]} if previous else {current[0]}
+            self.apply_deltas(deltas, touched_days=touched)
+
+        self._remember_state(current)
 
     def __str__(self):
         return f"{self.get_event_type_display()} - {self.amount} руб."
\ No newline at end of file
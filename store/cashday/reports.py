@@ -0,0 +1,127 @@
+# cashday/reports.py
+"""
+Отчеты по продажам.
+
+Вся агрегация выполняется в БД (GROUP BY по усеченной дате / часу), поэтому
+число запросов отчета не зависит от длины периода.
+"""
+from decimal import Decimal
+
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, Trunc
+
+from .models import CashDay, SaleEvent
+
+PERIODS = ('day', 'week', 'month')
+
+PAID_SALE = Q(event_type='sale', payment_type__in=['cash', 'card'])
+
+
+def _events(start, end):
+    """События торговых дней с start по end включительно"""
+    return SaleEvent.objects.filter(cash_day__date__gte=start, cash_day__date__lte=end)
+
+
+def revenue(start, end, period='day'):
+    """Выручка, число и средний чек продаж, возвраты - по дням / неделям / месяцам"""
+    if period not in PERIODS:
+        raise ValueError(f'period должен быть одним из: {", ".join(PERIODS)}')
+    return list(
+        _events(start, end)
+        .annotate(period=Trunc('cash_day__date', period))
+        .values('period')
+        .annotate(
+            revenue=Sum('amount', filter=PAID_SALE, default=0),
+            cash_total=Sum('amount', filter=PAID_SALE & Q(payment_type='cash'), default=0),
+            card_total=Sum('amount', filter=PAID_SALE & Q(payment_type='card'), default=0),
+            sales_count=Count('pk', filter=PAID_SALE),
+            average_ticket=Avg('amount', filter=PAID_SALE),
+            returns_total=Sum('amount', filter=Q(event_type='return'), default=0),
+            events_count=Count('pk'),
+        )
+        .order_by('period')
+    )
+
+
+def event_counts(start, end):
+    """Количество и сумма событий в разрезе типа события и типа оплаты"""
+    return list(
+        _events(start, end)
+        .values('event_type', 'payment_type')
+        .annotate(count=Count('pk'), total=Sum('amount', default=0))
+        .order_by('event_type', 'payment_type')
+    )
+
+
+def hourly_heatmap(start, end):
+    """Продажи по дню недели (1 - понедельник) и часу события"""
+    return list(
+        _events(start, end)
+        .filter(PAID_SALE)
+        .annotate(weekday=ExtractIsoWeekDay('timestamp'), hour=ExtractHour('timestamp'))
+        .values('weekday', 'hour')
+        .annotate(sales_count=Count('pk'), revenue=Sum('amount'))
+        .order_by('weekday', 'hour')
+    )
+
+
+# Денежные поля снимка: в JSON они хранятся строками (DjangoJSONEncoder)
+SNAPSHOT_DECIMALS = ('revenue', 'average_ticket', 'returns_total')
+
+
+def _from_snapshot(snapshot, keys):
+    """Итоги дня из снимка с денежными значениями в Decimal, как у открытых дней"""
+    totals = {key: snapshot.get(key) for key in keys}
+    for key in SNAPSHOT_DECIMALS:
+        if totals.get(key) is not None:
+            totals[key] = Decimal(str(totals[key]))
+    return totals
+
+
+def daily_summary(start, end):
+    """
+    Итоги по дням. Закрытые дни читаются из снимка (одна строка CashDay),
+    по открытым дням события агрегируются одним запросом.
+    """
+    days = list(
+        CashDay.objects.filter(date__gte=start, date__lte=end)
+        .order_by('date')
+        .values('id', 'date', 'is_closed', 'snapshot')
+    )
+    open_ids = [day['id'] for day in days if not day['is_closed']]
+    live = {}
+    if open_ids:
+        live = {
+            row.pop('cash_day_id'): row
+            for row in SaleEvent.objects.filter(cash_day_id__in=open_ids)
+            .values('cash_day_id')
+            .annotate(
+                revenue=Sum('amount', filter=PAID_SALE, default=0),
+                sales_count=Count('pk', filter=PAID_SALE),
+                average_ticket=Avg('amount', filter=PAID_SALE),
+                returns_total=Sum('amount', filter=Q(event_type='return'), default=0),
+                events_count=Count('pk'),
+            )
+            .order_by()
+        }
+
+    empty = {
+        'revenue': Decimal(0), 'sales_count': 0, 'average_ticket': None,
+        'returns_total': Decimal(0), 'events_count': 0,
+    }
+    result = []
+    for day in days:
+        if day['is_closed'] and day['snapshot']:
+            totals = _from_snapshot(day['snapshot'], empty)
+        else:
+            totals = live.get(day['id'], empty)
+        result.append({'date': day['date'], 'is_closed': day['is_closed'], **totals})
+    return result
+
+
+REPORTS = {
+    'revenue': revenue,
+    'events': event_counts,
+    'heatmap': hourly_heatmap,
+    'days': daily_summary,
+}
@@ -0,0 +1,22 @@
+# cashday/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import CashDay, SaleEvent
+
+
+@receiver(post_delete, sender=SaleEvent)
+def subtract_deleted_event(sender, instance, origin=None, **kwargs):
+    """
+    Удаление события (экземпляра или queryset) вычитает его вклад из итогов дня.
+    При каскадном удалении самого CashDay пересчитывать нечего.
+    Итоги закрытого дня add_sales не меняет; удаление его событий
+    запрещает админка (SaleEventAdmin).
+    """
+    if isinstance(origin, CashDay) or getattr(origin, 'model', None) is CashDay:
+        return
+    state = getattr(instance, '_saved_state', None) or instance._current_state()
+    old = SaleEvent.contribution(state)
+    if old:
+        cash_day_id, payment_type, amount = old
+        CashDay.add_sales(cash_day_id, payment_type, -amount, count=-1)
@@ -1,3 +1,364 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import ingest, reports
+from .models import CashDay, SaleEvent
+
+
+class SaleEventTotalsTests(TestCase):
+    def setUp(self):
+        self.day = CashDay.objects.create(date=date(2025, 1, 1))
+
+    def test_sale_updates_day_in_one_statement(self):
+        event = SaleEvent(cash_day=self.day, event_type='sale', payment_type='cash', amount=Decimal('150.00'))
+        with CaptureQueriesContext(connection) as ctx:
+            event.save()
+        statements = [q['sql'].split()[0].upper() for q in ctx.captured_queries]
+        # Итоги дня не читаются, а меняются одним UPDATE
+        self.assertNotIn('SELECT', statements)
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.cash_sales_total, Decimal('150.00'))
+        self.assertEqual(self.day.cash_sales_count, 1)
+        self.assertEqual(self.day.total_sales, Decimal('150.00'))
+
+    def test_non_sale_events_do_not_touch_totals(self):
+        SaleEvent.objects.create(cash_day=self.day, event_type='fitting', payment_type='none')
+        SaleEvent.objects.create(cash_day=self.day, event_type='sale', payment_type='none', amount=10)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.total_sales, 0)
+
+
+class ConcurrentSalesTests(TransactionTestCase):
+    THREADS = 8
+    SALES_PER_THREAD = 25
+
+    def test_parallel_tills_do_not_lose_updates(self):
+        day = CashDay.objects.create(date=date(2025, 1, 2))
+        errors = []
+
+        def post_sale(payment_type):
+            # SQLite отдает 'table is locked' вместо ожидания - касса повторяет попытку.
+            # Неудачная попытка откатывается целиком, поэтому двойного учета нет.
+            for _ in range(100):
+                try:
+                    return SaleEvent.objects.create(
+                        cash_day_id=day.pk, event_type='sale',
+                        payment_type=payment_type, amount=Decimal('10.00')
+                    )
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(0.005)
+            raise AssertionError('sale was not posted')
+
+        def till(payment_type):
+            try:
+                for _ in range(self.SALES_PER_THREAD):
+                    post_sale(payment_type)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=till, args=('cash' if i % 2 else 'card',))
+            for i in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        day.refresh_from_db()
+        sales = self.THREADS * self.SALES_PER_THREAD
+        self.assertEqual(day.cash_sales_count + day.card_sales_count, sales)
+        self.assertEqual(day.total_sales, Decimal('10.00') * sales)
+        self.assertEqual(day.cash_sales_total + day.card_sales_total, day.total_sales)
+
+
+@override_settings(API_TOKENS=['till-1'])
+class SaleEventBatchTests(TestCase):
+    def setUp(self):
+        # Касса: без сессии и CSRF-cookie, с токеном устройства
+        self.client = Client(enforce_csrf_checks=True, headers={'Authorization': 'Token till-1'})
+
+    def post(self, events):
+        return self.client.post(reverse('sale-event-batch'), events, content_type='application/json')
+
+    def test_batch_is_idempotent(self):
+        events = [
+            {'client_event_id': f'till1-{i}', 'date': '2025-02-01', 'event_type': 'sale',
+             'payment_type': 'cash' if i % 2 else 'card', 'amount': '10.50'}
+            for i in range(10)
+        ] + [
+            {'client_event_id': 'till1-fit', 'date': '2025-02-01', 'event_type': 'fitting'},
+            {'client_event_id': 'till1-bad', 'date': '2025-02-01', 'event_type': 'unknown'},
+        ]
+        first = self.post(events).json()
+        self.assertEqual(first['accepted'], 11)
+        self.assertEqual([e['client_event_id'] for e in first['errors']], ['till1-bad'])
+
+        second = self.post(events).json()
+        self.assertEqual(second['accepted'], 0)
+        self.assertEqual(len(second['duplicates']), 11)
+
+        day = CashDay.objects.get(date=date(2025, 2, 1))
+        self.assertEqual(day.cash_sales_count, 5)
+        self.assertEqual(day.card_sales_count, 5)
+        self.assertEqual(day.total_sales, Decimal('105.00'))
+        self.assertEqual(SaleEvent.objects.count(), 11)
+
+    def test_updates_are_aggregated_per_day_and_payment(self):
+        events = [
+            {'client_event_id': str(i), 'date': '2025-02-02', 'event_type': 'sale',
+             'payment_type': 'cash', 'amount': 1}
+            for i in range(50)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            self.post(events)
+        day_updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "cashday_cashday"')]
+        self.assertEqual(len(day_updates), 1)
+        self.assertEqual(CashDay.objects.get(date=date(2025, 2, 2)).cash_sales_total, Decimal('50'))
+
+    def test_event_written_concurrently_is_a_duplicate(self):
+        other_day = CashDay.objects.create(date=date(2025, 2, 3))
+        SaleEvent.objects.create(
+            cash_day=other_day, event_type='sale', payment_type='cash',
+            amount=5, client_event_id='race-1',
+        )
+        events = [
+            {'client_event_id': f'race-{i}', 'date': '2025-02-04', 'event_type': 'sale',
+             'payment_type': 'cash', 'amount': 1}
+            for i in range(3)
+        ]
+        # Параллельная выгрузка за другой день записала race-1 после проверки
+        with mock.patch.object(ingest, '_known_ids', return_value=set()):
+            response = self.post(events)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['accepted'], 2)
+        self.assertEqual(data['duplicates'], ['race-1'])
+        day = CashDay.objects.get(date=date(2025, 2, 4))
+        self.assertEqual((day.cash_sales_count, day.cash_sales_total), (2, Decimal('2')))
+
+
+    def test_token_required(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(reverse('sale-event-batch'), [], content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+class SalesReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for day_number in range(1, 41):
+            day = CashDay.objects.create(date=date(2025, 3, 1) + timedelta(days=day_number - 1))
+            SaleEvent.objects.create(cash_day=day, event_type='sale', payment_type='cash', amount=100)
+            SaleEvent.objects.create(cash_day=day, event_type='sale', payment_type='card', amount=300)
+            SaleEvent.objects.create(cash_day=day, event_type='price_request')
+
+    def test_query_count_does_not_depend_on_range(self):
+        for end in (date(2025, 3, 1), date(2025, 4, 9)):
+            for report in (reports.revenue, reports.event_counts, reports.hourly_heatmap):
+                with self.assertNumQueries(1):
+                    report(date(2025, 3, 1), end)
+
+    def test_revenue_by_month(self):
+        rows = reports.revenue(date(2025, 3, 1), date(2025, 4, 9), period='month')
+        self.assertEqual([row['sales_count'] for row in rows], [62, 18])
+        self.assertEqual(rows[0]['revenue'], Decimal('12400'))
+        self.assertEqual(rows[0]['average_ticket'], Decimal('200'))
+
+    def test_endpoint_and_export(self):
+        response = self.client.get(
+            reverse('sales-report', args=['events']), {'start': '2025-03-01', 'end': '2025-03-02'}
+        )
+        counts = {(r['event_type'], r['payment_type']): r['count'] for r in response.json()['results']}
+        self.assertEqual(counts[('sale', 'cash')], 2)
+        self.assertEqual(counts[('price_request', 'none')], 2)
+
+        out = StringIO()
+        call_command('export_sales_report', 'heatmap', '--start', '2025-03-01', '--end', '2025-03-07', stdout=out)
+        self.assertTrue(out.getvalue().startswith('weekday,hour,sales_count,revenue'))
+
+
+class CashDayCloseTests(TestCase):
+    def setUp(self):
+        self.day = CashDay.objects.create(date=date(2025, 5, 1))
+        SaleEvent.objects.create(cash_day=self.day, event_type='sale', payment_type='cash', amount=100)
+        SaleEvent.objects.create(cash_day=self.day, event_type='sale', payment_type='card', amount=50)
+        SaleEvent.objects.create(cash_day=self.day, event_type='return', payment_type='cash', amount=20)
+
+    def test_close_fixes_drift_and_freezes(self):
+        CashDay.objects.filter(pk=self.day.pk).update(cash_sales_total=999, cash_sales_count=7)
+        drift = self.day.close()
+
+        self.assertEqual(drift['cash_sales_total'], (Decimal('999'), Decimal('100')))
+        self.assertEqual(drift['cash_sales_count'], (7, 1))
+        self.day.refresh_from_db()
+        self.assertTrue(self.day.is_closed)
+        self.assertEqual(self.day.total_sales, Decimal('150'))
+        self.assertEqual(self.day.snapshot['sales_count'], 2)
+        self.assertEqual(Decimal(self.day.snapshot['returns_total']), Decimal('20'))
+
+        with self.assertRaises(ValidationError):
+            SaleEvent.objects.create(cash_day=self.day, event_type='sale', payment_type='cash', amount=1)
+        with self.assertRaises(ValidationError):
+            SaleEvent.objects.create(cash_day=self.day, event_type='fitting')
+        self.assertEqual(SaleEvent.objects.filter(cash_day=self.day).count(), 3)
+
+    def test_closed_day_summary_reads_snapshot(self):
+        self.day.close()
+        CashDay.objects.create(date=date(2025, 5, 2))
+        with self.assertNumQueries(2):
+            rows = reports.daily_summary(date(2025, 5, 1), date(2025, 5, 2))
+        self.assertIsInstance(rows[0]['revenue'], Decimal)
+        self.assertEqual(rows[0]['revenue'], Decimal('150'))
+        self.assertEqual(rows[0]['returns_total'], Decimal('20'))
+        self.assertEqual(rows[1]['sales_count'], 0)
+
+    def test_close_endpoint_twice(self):
+        url = reverse('cash-day-close', args=['2025-05-01'])
+        self.assertEqual(self.client.post(url).json()['drift'], {})
+        self.assertEqual(self.client.post(url).status_code, 409)
+
+
+class ClosedDayAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'a@example.com', 'pw'))
+        self.day = CashDay.objects.create(date=date(2025, 5, 10))
+        self.event = SaleEvent.objects.create(cash_day=self.day, event_type='sale', payment_type='cash', amount=10)
+        self.day.close()
+
+    def test_event_on_closed_day_is_a_form_error(self):
+        response = self.client.post(reverse('admin:cashday_saleevent_add'), {
+            'cash_day': self.day.pk, 'event_type': 'sale', 'payment_type': 'cash', 'amount': '5',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Торговый день закрыт')
+        self.assertEqual(SaleEvent.objects.count(), 1)
+
+        response = self.client.post(reverse('admin:cashday_saleevent_change', args=[self.event.pk]), {
+            'cash_day': self.day.pk, 'event_type': 'sale', 'payment_type': 'cash', 'amount': '50',
+        })
+        self.assertContains(response, 'Торговый день закрыт')
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.amount, Decimal('10'))
+
+    def test_events_of_closed_day_are_not_deleted(self):
+        open_day = CashDay.objects.create(date=date(2025, 5, 11))
+        open_event = SaleEvent.objects.create(cash_day=open_day, event_type='fitting')
+
+        response = self.client.get(reverse('admin:cashday_saleevent_delete', args=[self.event.pk]))
+        self.assertEqual(response.status_code, 403)
+
+        changelist = reverse('admin:cashday_saleevent_changelist')
+        response = self.client.post(changelist, {
+            'action': 'delete_selected', '_selected_action': [self.event.pk, open_event.pk], 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(SaleEvent.objects.count(), 2)
+
+        response = self.client.post(changelist, {
+            'action': 'delete_selected', '_selected_action': [open_event.pk], 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(SaleEvent.objects.values_list('pk', flat=True)), [self.event.pk])
+
+    def test_closed_day_totals_are_readonly(self):
+        response = self.client.post(reverse('admin:cashday_cashday_change', args=[self.day.pk]), {
+            'date': '2025-05-10', 'cash_sales_total': '999', 'cash_sales_count': '9',
+            'card_sales_total': '0', 'card_sales_count': '0',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.day.refresh_from_db()
+        self.assertEqual((self.day.cash_sales_total, self.day.cash_sales_count), (Decimal('10'), 1))
+
+
+class SaleEventDeltaTests(TestCase):
+    def setUp(self):
+        self.day = CashDay.objects.create(date=date(2025, 6, 1))
+        self.other_day = CashDay.objects.create(date=date(2025, 6, 2))
+        self.event = SaleEvent.objects.create(
+            cash_day=self.day, event_type='sale', payment_type='cash', amount=100
+        )
+
+    def assertTotals(self, day, cash=0, cash_count=0, card=0, card_count=0):
+        day.refresh_from_db()
+        self.assertEqual(
+            (day.cash_sales_total, day.cash_sales_count, day.card_sales_total, day.card_sales_count, day.total_sales),
+            (Decimal(cash), cash_count, Decimal(card), card_count, Decimal(cash) + Decimal(card)),
+        )
+
+    def test_edit_applies_only_difference(self):
+        event = SaleEvent.objects.get(pk=self.event.pk)
+        event.amount = Decimal('120')
+        event.save()
+        self.assertTotals(self.day, cash=120, cash_count=1)
+
+        event.notes = 'опечатка исправлена'
+        event.save()
+        self.assertTotals(self.day, cash=120, cash_count=1)
+
+        event.payment_type = 'card'
+        event.save()
+        self.assertTotals(self.day, card=120, card_count=1)
+
+        event.cash_day = self.other_day
+        event.save()
+        self.assertTotals(self.day)
+        self.assertTotals(self.other_day, card=120, card_count=1)
+
+        event.event_type = 'fitting'
+        event.save()
+        self.assertTotals(self.other_day)
+
+    def test_update_fields_apply_only_written_fields(self):
+        event = SaleEvent.objects.get(pk=self.event.pk)
+        event.amount = Decimal('50')
+        event.notes = 'без суммы'
+        event.save(update_fields=['notes'])
+        self.assertTotals(self.day, cash=100, cash_count=1)
+
+        # Сумма записывается следующим полным сохранением
+        event.save()
+        self.assertTotals(self.day, cash=50, cash_count=1)
+
+        event.cash_day = self.other_day
+        event.save(update_fields=['cash_day'])
+        self.assertTotals(self.day)
+        self.assertTotals(self.other_day, cash=50, cash_count=1)
+
+    def test_delete_subtracts(self):
+        SaleEvent.objects.create(cash_day=self.day, event_type='sale', payment_type='card', amount=30)
+        SaleEvent.objects.create(cash_day=self.day, event_type='sale', payment_type='card', amount=20)
+        self.event.delete()
+        self.assertTotals(self.day, card=50, card_count=2)
+        SaleEvent.objects.filter(payment_type='card', amount=30).delete()
+        self.assertTotals(self.day, card=20, card_count=1)
+
+    def test_cascade_from_day_and_closed_day(self):
+        self.day.close()
+        # Итоги закрытого дня заморожены, сигнал их не меняет и не падает
+        SaleEvent.objects.create(
+            cash_day=self.other_day, event_type='sale', payment_type='cash', amount=5
+        )
+        closed_event = SaleEvent.objects.get(pk=self.event.pk)
+        closed_event.delete()
+        self.assertTotals(self.day, cash=100, cash_count=1)
+
+        self.other_day.delete()
+        self.assertFalse(SaleEvent.objects.exists())
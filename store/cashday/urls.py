@@ -0,0 +1,9 @@
+#  app cashday\urls
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('events/batch/', views.sale_event_batch, name='sale-event-batch'),
+    path('reports/<slug:report>/', views.sales_report, name='sales-report'),
+    path('days/<str:day>/close/', views.cash_day_close, name='cash-day-close'),
+]
@@ -1,3 +1,80 @@
-from django.shortcuts import render
+import json
+from datetime import date, timedelta
 
-# Create your views here.
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.utils import timezone
+
+from product.api_auth import api_token_required
+
+from . import reports
+from .ingest import MAX_BATCH_SIZE, ingest_sale_events
+from .models import CashDay
+
+DEFAULT_REPORT_DAYS = 30
+
+
+@api_token_required
+def sale_event_batch(request):
+    """
+    Пакетная выгрузка событий с кассы: JSON-массив объектов
+    {client_event_id, date, event_type, payment_type, amount, notes, timestamp}.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный JSON'}, status=400)
+    if not isinstance(payload, list):
+        return JsonResponse({'error': 'Ожидается массив событий'}, status=400)
+    if len(payload) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'Не более {MAX_BATCH_SIZE} событий за запрос'}, status=400)
+
+    return JsonResponse(ingest_sale_events(payload))
+
+
+def _report_range(request):
+    """?start=YYYY-MM-DD&end=YYYY-MM-DD, по умолчанию - последние 30 дней"""
+    end = request.GET.get('end')
+    end = date.fromisoformat(end) if end else timezone.localdate()
+    start = request.GET.get('start')
+    start = date.fromisoformat(start) if start else end - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+    if start > end:
+        raise ValueError('start не может быть позже end')
+    return start, end
+
+
+def sales_report(request, report):
+    if report not in reports.REPORTS:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    try:
+        start, end = _report_range(request)
+        kwargs = {'period': request.GET.get('period', 'day')} if report == 'revenue' else {}
+        rows = reports.REPORTS[report](start, end, **kwargs)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'start': start, 'end': end, 'results': rows})
+
+
+def cash_day_close(request, day):
+    """Закрытие торгового дня: сверка итогов с событиями и снимок"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        cash_day = CashDay.objects.get(date=date.fromisoformat(day))
+    except (ValueError, CashDay.DoesNotExist):
+        return JsonResponse({'error': 'Not found'}, status=404)
+
+    try:
+        drift = cash_day.close()
+    except ValidationError as e:
+        return JsonResponse({'error': '; '.join(e.messages)}, status=409)
+
+    return JsonResponse({
+        'date': cash_day.date,
+        'drift': {name: {'stored': old, 'actual': new} for name, (old, new) in drift.items()},
+        'snapshot': cash_day.snapshot,
+    })
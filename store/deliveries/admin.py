@@ -1,3 +1,30 @@
+# app deliveries\admin
 from django.contrib import admin
 
-# Register your models here.
+from .models import Delivery, DeliveryItem
+
+
+class DeliveryItemInline(admin.TabularInline):
+    model = DeliveryItem
+    fields = ('product', 'quantity_received', 'price_per_unit', 'request_item')
+    raw_id_fields = ('product', 'request_item')
+    extra = 0
+
+
+@admin.register(Delivery)
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'supplier', 'delivery_date', 'items_count', 'total_amount')
+    list_filter = ('supplier', 'delivery_date')
+    list_select_related = ('supplier',)
+    readonly_fields = ('total_amount',)
+    inlines = (DeliveryItemInline,)
+
+    def get_queryset(self, request):
+        # Число позиций считается в запросе списка, а не по строке
+        return super().get_queryset(request).with_totals()
+
+    def items_count(self, obj):
+        return obj.items_count
+
+    items_count.short_description = 'Позиций'
+    items_count.admin_order_field = 'items_count'
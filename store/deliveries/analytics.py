@@ -0,0 +1,206 @@
+# app deliveries/analytics
+"""
+Аналитика закупок по поставщикам.
+
+Отчеты строятся сгруппированными агрегатами в БД по (поставщик, [товар,] месяц):
+  volumes    - число поставок, количество и сумма закупок;
+  unit_costs - средневзвешенная, минимальная и максимальная цена за единицу;
+  lead_times - срок от создания единицы товара (заявки) до ее поставки, в днях.
+
+Результаты кешируются помесячно. У каждого месяца своя версия в кеше, которую
+сигналы увеличивают при изменении поставки этого месяца, поэтому правка одной
+поставки сбрасывает только ее месяц. Версии хранятся в общем для рабочих
+процессов кеше (см. CACHES в настройках) и живут не дольше самих отчетов.
+"""
+import time
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import (
+    Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Sum,
+)
+from django.db.models.functions import TruncDate, TruncMonth
+
+from .models import Delivery, DeliveryItem, line_total
+
+VERSION_KEY = 'deliveries:analytics:version:{month}'
+REPORT_KEY = 'deliveries:analytics:{report}:{month}:{version}'
+REPORT_TIMEOUT = 60 * 60 * 24
+VERSION_TIMEOUT = REPORT_TIMEOUT
+MAX_MONTHS = 36
+CENTS = Decimal('0.01')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months_between(start, end):
+    """Первые числа месяцев с start по end включительно"""
+    month, last = month_start(start), month_start(end)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def _items(start, end):
+    """Позиции поставок с датой поставки в месяцах [start, end]"""
+    return DeliveryItem.objects.filter(
+        delivery__delivery_date__gte=month_start(start),
+        delivery__delivery_date__lt=_next_month(month_start(end)),
+    ).annotate(
+        month=TruncMonth('delivery__delivery_date'),
+        supplier_id_=F('delivery__supplier_id'),
+        supplier_name=F('delivery__supplier__name'),
+    )
+
+
+def volumes(start, end):
+    """Объем закупок по поставщику и месяцу"""
+    return (
+        _items(start, end)
+        .values('month', 'supplier_id_', 'supplier_name')
+        .annotate(
+            deliveries=Count('delivery', distinct=True),
+            products=Count('product', distinct=True),
+            quantity=Sum('quantity_received'),
+            amount=Sum(line_total()),
+        )
+        .order_by('month', 'supplier_id_')
+    )
+
+
+def unit_costs(start, end):
+    """Цена за единицу по поставщику, товару и месяцу; средняя взвешена по количеству"""
+    return (
+        _items(start, end)
+        .values('month', 'supplier_id_', 'supplier_name', 'product_id', 'product__code')
+        .annotate(
+            quantity=Sum('quantity_received'),
+            amount=Sum(line_total()),
+            min_price=Min('price_per_unit'),
+            max_price=Max('price_per_unit'),
+        )
+        .order_by('month', 'supplier_id_', 'product_id')
+    )
+
+
+def lead_times(start, end):
+    """Средний, минимальный и максимальный срок поставки полученных единиц"""
+    Through = DeliveryItem.received_units.through
+    lead = ExpressionWrapper(
+        F('deliveryitem__delivery__delivery_date') - TruncDate('productunit__created_at'),
+        output_field=DurationField()
+    )
+    return (
+        Through.objects.filter(
+            deliveryitem__delivery__delivery_date__gte=month_start(start),
+            deliveryitem__delivery__delivery_date__lt=_next_month(month_start(end)),
+        )
+        .annotate(
+            month=TruncMonth('deliveryitem__delivery__delivery_date'),
+            supplier_id_=F('deliveryitem__delivery__supplier_id'),
+            supplier_name=F('deliveryitem__delivery__supplier__name'),
+            lead=lead,
+        )
+        .values('month', 'supplier_id_', 'supplier_name')
+        .annotate(units=Count('pk'), avg_lead=Avg('lead'), min_lead=Min('lead'), max_lead=Max('lead'))
+        .order_by('month', 'supplier_id_')
+    )
+
+
+def _clean_row(row):
+    """Имена колонок и сроки в днях для выдачи"""
+    row['supplier_id'] = row.pop('supplier_id_')
+    if 'product__code' in row:
+        row['product_code'] = row.pop('product__code')
+        # Деление после агрегации: в SQLite NUMERIC / INTEGER целочисленно
+        row['avg_unit_cost'] = (
+            (Decimal(row['amount']) / row['quantity']).quantize(CENTS) if row['quantity'] else None
+        )
+    for key in ('avg_lead', 'min_lead', 'max_lead'):
+        if key in row:
+            value = row.pop(key)
+            row[f'{key}_days'] = round(value.total_seconds() / 86400, 1) if value is not None else None
+    return row
+
+
+def iter_rows(report, start, end, chunk_size=2000):
+    """Строки отчета потоком из БД, без кеша и без накопления в памяти"""
+    for row in REPORTS[report](start, end).iterator(chunk_size=chunk_size):
+        yield _clean_row(row)
+
+
+def _versions(months):
+    keys = {month: VERSION_KEY.format(month=f'{month:%Y-%m}') for month in months}
+    found = cache.get_many(keys.values())
+    # Начальная версия от времени: после вытеснения ключа версии старые
+    # записи отчетов не совпадут с новой версией
+    missing = {key: int(time.time()) for key in keys.values() if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=VERSION_TIMEOUT)
+        found.update(missing)
+    return {month: found[key] for month, key in keys.items()}
+
+
+def get_report(report, start, end):
+    """
+    Строки отчета за месяцы с start по end. Месяцы, которых нет в кеше,
+    считаются одним запросом и кешируются по отдельности.
+    """
+    if report not in REPORTS:
+        raise ValueError(f'Неизвестный отчет: {report}')
+    months = months_between(start, end)
+    if not months:
+        raise ValueError('start не может быть позже end')
+    if len(months) > MAX_MONTHS:
+        raise ValueError(f'Не более {MAX_MONTHS} месяцев за запрос')
+
+    versions = _versions(months)
+    keys = {
+        month: REPORT_KEY.format(report=report, month=f'{month:%Y-%m}', version=versions[month])
+        for month in months
+    }
+    cached = cache.get_many(keys.values())
+    missing = [month for month in months if keys[month] not in cached]
+    if missing:
+        by_month = defaultdict(list)
+        for row in REPORTS[report](missing[0], missing[-1]):
+            by_month[row['month']].append(_clean_row(row))
+        fresh = {keys[month]: by_month[month] for month in missing}
+        cache.set_many(fresh, timeout=REPORT_TIMEOUT)
+        cached.update(fresh)
+
+    return [row for month in months for row in cached[keys[month]]]
+
+
+def invalidate(*days):
+    """Сбрасывает кеш отчетов за месяцы указанных дат"""
+    for month in {month_start(day) for day in days if day}:
+        key = VERSION_KEY.format(month=f'{month:%Y-%m}')
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Версии нет - значит, и кеша за этот месяц нет
+            continue
+        cache.touch(key, VERSION_TIMEOUT)
+
+
+def invalidate_deliveries(delivery_ids):
+    """Сбрасывает кеш за месяцы указанных поставок (один запрос за датами)"""
+    invalidate(*Delivery.objects.filter(pk__in=delivery_ids).values_list('delivery_date', flat=True))
+
+
+REPORTS = {
+    'volumes': volumes,
+    'unit-costs': unit_costs,
+    'lead-times': lead_times,
+}
@@ -0,0 +1,53 @@
+import csv
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from deliveries import analytics
+
+
+def month(value):
+    year, month_ = value.split('-')
+    return date(int(year), int(month_), 1)
+
+
+class Command(BaseCommand):
+    help = 'Export supplier purchasing analytics (volumes, unit-costs or lead-times) to CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'report',
+            choices=sorted(analytics.REPORTS),
+            help='Report to export'
+        )
+        parser.add_argument('--start', type=month, required=True, help='First month, YYYY-MM')
+        parser.add_argument('--end', type=month, required=True, help='Last month, YYYY-MM')
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='Output CSV file (default: stdout)'
+        )
+
+    def handle(self, *args, **options):
+        if options['start'] > options['end']:
+            raise CommandError('--start must not be after --end')
+
+        # Строки читаются из БД курсором и сразу пишутся, минуя кеш
+        rows = analytics.iter_rows(options['report'], options['start'], options['end'])
+        if options['output'] == '-':
+            self.write_csv(self.stdout, rows)
+        else:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                count = self.write_csv(f, rows)
+            self.stdout.write(self.style.SUCCESS(f'Saved {count} rows to {options["output"]}'))
+
+    def write_csv(self, stream, rows):
+        writer = None
+        count = 0
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(stream, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+            count += 1
+        return count
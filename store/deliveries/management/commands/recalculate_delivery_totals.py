@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from deliveries.models import Delivery
+
+
+class Command(BaseCommand):
+    help = 'Recompute Delivery.total_amount from delivery items in a single UPDATE'
+
+    def handle(self, *args, **options):
+        updated = Delivery.objects.all().recalculate_totals()
+        self.stdout.write(self.style.SUCCESS(f'Totals recalculated for {updated} deliveries'))
@@ -1,8 +1,46 @@
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
-from store.suppliers.models import Supplier
+from suppliers.models import Supplier
+
+
+def line_total(prefix=''):
+    """Выражение quantity_received * price_per_unit для позиции (prefix - путь до нее)"""
+    return ExpressionWrapper(
+        F(f'{prefix}quantity_received') * F(f'{prefix}price_per_unit'),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+class DeliveryQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Поставки с суммой и числом позиций, посчитанными в том же запросе,
+        чтобы списки не обращались к позициям построчно
+        """
+        return self.annotate(
+            items_total=Coalesce(
+                Sum(line_total('items__')),
+                Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+            ),
+            items_count=Count('items'),
+        )
+
+    def recalculate_totals(self):
+        """Пересчитывает total_amount всех поставок queryset одним UPDATE"""
+        totals = (
+            DeliveryItem.objects.filter(delivery_id=OuterRef('pk'))
+            .values('delivery_id')
+            .annotate(total=Sum(line_total()))
+            .values('total')
+        )
+        return self.update(total_amount=Coalesce(
+            Subquery(totals),
+            Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+        ))
 
 
 class Delivery(models.Model):
@@ -17,10 +55,14 @@ class Delivery(models.Model):
         'Сумма поставки',
         max_digits=12,
         decimal_places=2,
-        default=0
+        default=0,
+        editable=False,
+        help_text='Сумма позиций, пересчитывается автоматически'
     )
     notes = models.TextField('Примечания', blank=True)
 
+    objects = DeliveryQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Поставка'
         verbose_name_plural = 'Поставки'
@@ -29,16 +71,32 @@ class Delivery(models.Model):
     def __str__(self):
         return f"Поставка #{self.id} от {self.delivery_date}"
 
-
-.class DeliveryItem(models.Model):
-    delivery = models.ForeignKey(   # нету
-        'unit.Delivery',
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Дата из БД: при переносе поставки сбрасывается кеш аналитики обоих месяцев
+        instance._saved_delivery_date = instance.__dict__.get('delivery_date')
+        return instance
+
+    @classmethod
+    def recalculate_total(cls, pk):
+        """Пересчитывает total_amount одним агрегатом по позициям поставки"""
+        total = DeliveryItem.objects.filter(delivery_id=pk).aggregate(
+            total=Sum(line_total())
+        )['total'] or 0
+        cls.objects.filter(pk=pk).update(total_amount=total)
+        return total
+
+
+class DeliveryItem(models.Model):
+    delivery = models.ForeignKey(
+        Delivery,
         on_delete=models.CASCADE,
         related_name='items',
         verbose_name='Поставка'
     )
     product = models.ForeignKey(
-        'goods.Product',
+        'product.Product',
         on_delete=models.PROTECT,
         verbose_name='Товар'
     )
@@ -53,7 +111,7 @@ class Delivery(models.Model):
         decimal_places=2
     )
     request_item = models.ForeignKey(
-        'warehouse.RequestItem',
+        'request_units.RequestItem',
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
@@ -75,6 +133,13 @@ class Delivery(models.Model):
     def __str__(self):
         return f"{self.product.name} x {self.quantity_received} (Поставка #{self.delivery.id})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Поставка из БД: при переносе позиции пересчитываются суммы обеих
+        instance._saved_delivery_id = instance.__dict__.get('delivery_id')
+        return instance
+
     def clean(self):
         """Валидация данных перед сохранением"""
         errors = {}
@@ -90,24 +155,6 @@ class Delivery(models.Model):
         if errors:
             raise ValidationError(errors)
 
-    def save(self, *args, **kwargs):
-        """
-        Сохранение с обработкой полученных единиц
-        """
-        # Временное хранение units перед сохранением
-        tmp_units = list(self.received_units.all()) if self.pk else []
-
-        # Основное сохранение
-        super().save(*args, **kwargs)
-
-        # Обновление статусов units
-        if tmp_units:
-            from django.db.models import F
-            self.received_units.set(tmp_units)
-            self.received_units.filter(status__in=['in_request', 'in_store']).update(
-                status='in_store'
-            )
-
     @property
     def total_price(self):
         """Вычисляемая общая сумма"""
@@ -0,0 +1,151 @@
+# app deliveries/receiving
+"""
+Приемка поставки сканером.
+
+receive_units() принимает пачку отсканированных серийных номеров и за
+фиксированное число запросов, независимо от размера пачки:
+находит единицы одним SELECT, привязывает их к позициям поставки одним
+bulk_create по промежуточной таблице, переводит в in_store одним UPDATE
+и пересчитывает total_amount одним агрегатом.
+
+Если в поставке несколько позиций одного товара, единица попадает в позицию
+своей заявки (request_item); без однозначного совпадения она не принимается.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, OuterRef, Subquery, Value, When
+
+from unit.lifecycle import allowed_sources, transition
+from unit.models import ProductUnit
+
+from . import analytics
+from .models import Delivery, DeliveryItem
+
+MAX_SCAN_BATCH = 5000
+THROUGH_BATCH_SIZE = 1000
+
+
+@dataclass
+class ReceiveResult:
+    received: list = field(default_factory=list)
+    already_received: list = field(default_factory=list)
+    unknown: list = field(default_factory=list)
+    not_in_delivery: list = field(default_factory=list)
+    wrong_status: list = field(default_factory=list)
+    ambiguous: list = field(default_factory=list)
+    total_amount: object = None
+
+    def as_dict(self):
+        return {
+            'received': self.received,
+            'already_received': self.already_received,
+            'unknown': self.unknown,
+            'not_in_delivery': self.not_in_delivery,
+            'wrong_status': self.wrong_status,
+            'ambiguous': self.ambiguous,
+            'total_amount': self.total_amount,
+        }
+
+
+def receive_units(delivery, serials):
+    """
+    Принимает на склад единицы с серийными номерами serials по поставке delivery.
+
+    Единица попадает в позицию поставки с тем же товаром, а из нескольких
+    таких позиций - в позицию с ее заявкой. Уже принятые по этой поставке,
+    неизвестные, чужие, неоднозначные и находящиеся в неподходящем статусе
+    серийники не меняются и возвращаются в соответствующих списках ReceiveResult.
+    Количество принятого по затронутым позициям становится равным числу
+    привязанных единиц.
+    """
+    delivery_id = getattr(delivery, 'pk', delivery)
+    serials = list(dict.fromkeys(str(serial) for serial in serials))
+    if len(serials) > MAX_SCAN_BATCH:
+        raise ValueError(f'Не более {MAX_SCAN_BATCH} серийных номеров за раз')
+
+    result = ReceiveResult()
+    Through = DeliveryItem.received_units.through
+    sources = allowed_sources('in_store')
+
+    with transaction.atomic():
+        items = defaultdict(list)  # product_id -> [(pk позиции, request_item_id)]
+        for pk, product_id, request_item_id in DeliveryItem.objects.filter(
+            delivery_id=delivery_id
+        ).values_list('pk', 'product_id', 'request_item_id'):
+            items[product_id].append((pk, request_item_id))
+        # Статусы читаются под блокировкой: параллельная операция не сменит их
+        # между проверкой и переводом в in_store
+        units = {
+            serial: (pk, product_id, status, request_item_id)
+            for pk, serial, product_id, status, request_item_id in ProductUnit.objects.select_for_update()
+            .filter(serial_number__in=serials)
+            .values_list('pk', 'serial_number', 'product_id', 'status', 'request_item_id')
+        }
+        attached = set(
+            Through.objects.filter(
+                deliveryitem__delivery_id=delivery_id,
+                productunit_id__in=[unit[0] for unit in units.values()],
+            ).values_list('productunit_id', flat=True)
+        )
+
+        links = []
+        for serial in serials:
+            if serial not in units:
+                result.unknown.append(serial)
+                continue
+            pk, product_id, status, request_item_id = units[serial]
+            if pk in attached:
+                result.already_received.append(serial)
+                continue
+            if product_id not in items:
+                result.not_in_delivery.append(serial)
+                continue
+            candidates = items[product_id]
+            if len(candidates) > 1:
+                candidates = [item for item in candidates if request_item_id and item[1] == request_item_id]
+            if len(candidates) != 1:
+                result.ambiguous.append(serial)
+            elif status not in sources:
+                result.wrong_status.append(serial)
+            else:
+                result.received.append(serial)
+                links.append(Through(deliveryitem_id=candidates[0][0], productunit_id=pk))
+
+        if links:
+            Through.objects.bulk_create(
+                links, batch_size=THROUGH_BATCH_SIZE, ignore_conflicts=True
+            )
+            by_item = defaultdict(list)
+            for link in links:
+                by_item[link.deliveryitem_id].append(link.productunit_id)
+            unit_ids = [link.productunit_id for link in links]
+            # Одна ветка CASE на позицию поставки, а не на единицу
+            ProductUnit.objects.filter(pk__in=unit_ids).update(
+                supply_item_id=Case(
+                    *[When(pk__in=ids, then=Value(item_id)) for item_id, ids in by_item.items()],
+                    output_field=IntegerField(),
+                )
+            )
+            transition(
+                ProductUnit.objects.filter(pk__in=unit_ids),
+                'in_store',
+                note=f'Поставка #{delivery_id}',
+            )
+            received_count = (
+                Through.objects.filter(deliveryitem_id=OuterRef('pk'))
+                .values('deliveryitem_id')
+                .annotate(n=Count('pk'))
+                .values('n')
+            )
+            DeliveryItem.objects.filter(pk__in=list(by_item)).update(
+                quantity_received=Subquery(received_count)
+            )
+
+        result.total_amount = Delivery.recalculate_total(delivery_id)
+        if links:
+            transaction.on_commit(partial(analytics.invalidate_deliveries, [delivery_id]))
+
+    return result
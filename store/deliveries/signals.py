@@ -0,0 +1,75 @@
+# deliveries/signals.py
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analytics
+from .models import Delivery, DeliveryItem
+
+# id поставок, чей пересчет ждет фиксации транзакции (свой набор на поток,
+# как и соединение с БД)
+_state = threading.local()
+
+
+def _pending():
+    if not hasattr(_state, 'delivery_ids'):
+        _state.delivery_ids = set()
+    return _state.delivery_ids
+
+
+def _recalculate_total(delivery_id):
+    """on_commit: пересчет суммы и сброс аналитики поставки, один на транзакцию"""
+    pending = _pending()
+    if delivery_id not in pending:
+        # Уже пересчитана колбэком предыдущего изменения в этой транзакции
+        return
+    pending.discard(delivery_id)
+    Delivery.recalculate_total(delivery_id)
+    analytics.invalidate_deliveries([delivery_id])
+
+
+def schedule_total_recalculation(delivery_id):
+    """
+    Пересчет total_amount после фиксации транзакции - один на поставку,
+    сколько бы позиций ни изменилось: первый выполненный колбэк снимает
+    поставку из набора ожидающих, остальные ничего не делают. При откате
+    Django отбрасывает колбэки; оставшийся в наборе id пересчитает колбэк
+    следующего изменения этой поставки.
+    """
+    if delivery_id is None:
+        return
+    _pending().add(delivery_id)
+    transaction.on_commit(partial(_recalculate_total, delivery_id))
+
+
+@receiver(post_save, sender=DeliveryItem)
+def delivery_item_saved(sender, instance, **kwargs):
+    # Позиция перенесена в другую поставку - пересчитываются обе
+    previous = getattr(instance, '_saved_delivery_id', None)
+    if previous is not None and previous != instance.delivery_id:
+        schedule_total_recalculation(previous)
+    schedule_total_recalculation(instance.delivery_id)
+    instance._saved_delivery_id = instance.delivery_id
+
+
+@receiver(post_delete, sender=DeliveryItem)
+def delivery_item_deleted(sender, instance, origin=None, **kwargs):
+    # При каскадном удалении самой поставки пересчитывать нечего
+    if isinstance(origin, Delivery) or getattr(origin, 'model', None) is Delivery:
+        return
+    schedule_total_recalculation(instance.delivery_id)
+
+
+@receiver(post_save, sender=Delivery)
+def delivery_saved(sender, instance, created, **kwargs):
+    old_date = getattr(instance, '_saved_delivery_date', None)
+    transaction.on_commit(partial(analytics.invalidate, old_date, instance.delivery_date))
+    instance._saved_delivery_date = instance.delivery_date
+
+
+@receiver(post_delete, sender=Delivery)
+def delivery_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(analytics.invalidate, instance.delivery_date))
@@ -1,3 +1,307 @@
-from django.test import TestCase
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from product.models import Product
+from request_units.signals import RequestItem
+from suppliers.models import Supplier
+from unit.models import ProductStock, ProductUnit
+
+from . import analytics
+from .models import Delivery, DeliveryItem
+from .receiving import receive_units
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class DeliveryReceiveTests(TestCase):
+    def setUp(self):
+        supplier = Supplier.objects.create(name='ООО Ткань', contact_person='Иван', phone='1')
+        self.delivery = Delivery.objects.create(supplier=supplier, delivery_date=date(2025, 3, 1))
+        self.coat = Product.objects.create(code='C1', name='Пальто')
+        self.hat = Product.objects.create(code='H1', name='Шляпа')
+        self.other = Product.objects.create(code='O1', name='Зонт')
+        self.coat_item = DeliveryItem.objects.create(
+            delivery=self.delivery, product=self.coat, price_per_unit=Decimal('100.00')
+        )
+        self.hat_item = DeliveryItem.objects.create(
+            delivery=self.delivery, product=self.hat, price_per_unit=Decimal('25.50')
+        )
+        ProductUnit.objects.bulk_create(
+            [ProductUnit(product=self.coat, serial_number=f'C1-{i}', status='in_supply') for i in range(5)]
+            + [ProductUnit(product=self.hat, serial_number=f'H1-{i}', status='in_supply') for i in range(2)]
+            + [ProductUnit(product=self.other, serial_number='O1-0', status='in_supply'),
+               ProductUnit(product=self.coat, serial_number='C1-sold', status='sold')]
+        )
+
+    def test_receive_attaches_transitions_and_totals(self):
+        serials = [f'C1-{i}' for i in range(5)] + ['H1-0', 'H1-1', 'O1-0', 'C1-sold', 'NOPE', 'C1-0']
+        result = receive_units(self.delivery, serials)
+
+        self.assertEqual(len(result.received), 7)
+        self.assertEqual(result.unknown, ['NOPE'])
+        self.assertEqual(result.not_in_delivery, ['O1-0'])
+        self.assertEqual(result.wrong_status, ['C1-sold'])
+        self.assertEqual(self.coat_item.received_units.count(), 5)
+        self.assertEqual(
+            ProductUnit.objects.filter(supply_item=self.hat_item, status='in_store').count(), 2
+        )
+        self.assertEqual(
+            ProductStock.objects.get(product=self.coat, status='in_store').count, 5
+        )
+
+        self.delivery.refresh_from_db()
+        self.assertEqual(self.delivery.total_amount, Decimal('551.00'))
+        self.assertEqual(result.total_amount, Decimal('551.00'))
+
+    def test_items_of_same_product_are_matched_by_request(self):
+        first, second = (
+            RequestItem.objects.create(product=self.coat, quantity_ordered=1, is_customer_order=False)
+            for _ in range(2)
+        )
+        self.coat_item.request_item = first
+        self.coat_item.save()
+        second_item = DeliveryItem.objects.create(
+            delivery=self.delivery, product=self.coat, price_per_unit=Decimal('90.00'), request_item=second
+        )
+        ProductUnit.objects.filter(serial_number__in=['C1-0', 'C1-1']).update(request_item=first)
+        ProductUnit.objects.filter(serial_number='C1-2').update(request_item=second)
+
+        result = receive_units(self.delivery, ['C1-0', 'C1-1', 'C1-2', 'C1-3'])
+        self.assertEqual(result.received, ['C1-0', 'C1-1', 'C1-2'])
+        self.assertEqual(result.ambiguous, ['C1-3'])
+        self.assertEqual(self.coat_item.received_units.count(), 2)
+        self.assertEqual(list(second_item.received_units.values_list('serial_number', flat=True)), ['C1-2'])
+        # 2 x 100 + 1 x 90 и непринятая позиция шляп с количеством по умолчанию 1 x 25.50
+        self.assertEqual(result.total_amount, Decimal('315.50'))
+
+    def test_rescan_is_idempotent(self):
+        receive_units(self.delivery, ['C1-0', 'C1-1'])
+        result = receive_units(self.delivery, ['C1-0', 'C1-1', 'C1-2'])
+        self.assertEqual(result.received, ['C1-2'])
+        self.assertEqual(result.already_received, ['C1-0', 'C1-1'])
+        self.coat_item.refresh_from_db()
+        self.assertEqual(self.coat_item.quantity_received, 3)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        def count(serials):
+            with CaptureQueriesContext(connection) as ctx:
+                receive_units(self.delivery, serials)
+            return len(ctx.captured_queries)
+
+        # Счетчики остатков обновляются по товару, поэтому сравниваем пачки одного
+        # товара после первой приемки, создавшей счетчик in_store
+        receive_units(self.delivery, ['C1-0'])
+        small = count(['C1-1'])
+        large = count(['C1-2', 'C1-3', 'C1-4'])
+        self.assertEqual(small, large)
+
+    @override_settings(API_TOKENS=['scanner-1'])
+    def test_endpoint(self):
+        url = reverse('delivery-receive', args=[self.delivery.pk])
+        anonymous = Client(enforce_csrf_checks=True)
+        self.assertEqual(anonymous.post(url, '{"serials": []}', content_type='application/json').status_code, 401)
+
+        # Сканер: без сессии и CSRF-cookie, с токеном устройства
+        self.client = Client(enforce_csrf_checks=True, headers={'Authorization': 'Token scanner-1'})
+        response = self.client.post(url, json.dumps({'serials': ['C1-0', 'X']}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['received'], ['C1-0'])
+        self.assertEqual(response.json()['unknown'], ['X'])
+
+        response = self.client.post(url, '{"serials": 1}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('delivery-receive', args=[999]), '{"serials": []}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class DeliveryTotalsTests(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name='ООО Обувь', contact_person='Петр', phone='2')
+        self.product = Product.objects.create(code='B1', name='Ботинки')
+        self.delivery = Delivery.objects.create(supplier=self.supplier, delivery_date=date(2025, 4, 1))
+
+    def add_item(self, quantity, price):
+        return DeliveryItem.objects.create(
+            delivery=self.delivery, product=self.product,
+            quantity_received=quantity, price_per_unit=Decimal(price)
+        )
+
+    def total(self):
+        return Delivery.objects.values_list('total_amount', flat=True).get(pk=self.delivery.pk)
+
+    def test_recalculated_once_per_transaction(self):
+        with mock.patch.object(Delivery, 'recalculate_total', wraps=Delivery.recalculate_total) as recalculate:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self.add_item(2, '10.00')
+                    item = self.add_item(3, '5.50')
+                    item.quantity_received = 4
+                    item.save()
+                    self.assertFalse(recalculate.called)
+        recalculate.assert_called_once_with(self.delivery.pk)
+        self.assertEqual(self.total(), Decimal('42.00'))
+
+    def test_moved_item_recalculates_both_deliveries(self):
+        other = Delivery.objects.create(supplier=self.supplier, delivery_date=date(2025, 4, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item(2, '10.00')
+            self.add_item(1, '7.00')
+        item = DeliveryItem.objects.get(quantity_received=1)
+        item.delivery = other
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertEqual(self.total(), Decimal('20.00'))
+        self.assertEqual(Delivery.objects.values_list('total_amount', flat=True).get(pk=other.pk), Decimal('7.00'))
+
+    def test_item_delete_recalculates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item(2, '10.00')
+            item = self.add_item(3, '5.50')
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.total(), Decimal('20.00'))
+
+    def test_rolled_back_changes_do_not_recalculate(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.add_item(2, '10.00')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.total(), Decimal('0'))
+
+        # id поставки из отмененной транзакции не мешает следующему пересчету
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item(1, '3.00')
+        self.assertEqual(self.total(), Decimal('3.00'))
+
+    def test_recalculate_command(self):
+        self.add_item(2, '10.00')
+        Delivery.objects.update(total_amount=Decimal('999'))
+        call_command('recalculate_delivery_totals', stdout=StringIO())
+        self.assertEqual(self.total(), Decimal('20.00'))
+
+    def test_list_annotates_totals_in_one_query(self):
+        for day in range(2, 6):
+            delivery = Delivery.objects.create(supplier=self.supplier, delivery_date=date(2025, 4, day))
+            DeliveryItem.objects.create(delivery=delivery, product=self.product,
+                                        quantity_received=day, price_per_unit=Decimal('1.00'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('delivery-list'), {'limit': 3})
+        data = response.json()
+        self.assertEqual([Decimal(row['items_total']) for row in data['results']], [5, 4, 3])
+
+        response = self.client.get(reverse('delivery-list'), {'limit': 3, 'cursor': data['next_cursor']})
+        self.assertEqual([row['items_count'] for row in response.json()['results']], [1, 0])
+        response = self.client.get(reverse('delivery-list'), {'cursor': '2025-04-02:1'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SupplierAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.acme = Supplier.objects.create(name='Acme', contact_person='A', phone='1')
+        self.beta = Supplier.objects.create(name='Beta', contact_person='B', phone='2')
+        self.product = Product.objects.create(code='A1', name='Перчатки')
+        with self.captureOnCommitCallbacks(execute=True):
+            for supplier, day, quantity, price in [
+                (self.acme, date(2025, 1, 10), 10, '2.00'),
+                (self.acme, date(2025, 1, 20), 30, '3.00'),
+                (self.beta, date(2025, 1, 15), 5, '4.00'),
+                (self.acme, date(2025, 2, 5), 1, '5.00'),
+            ]:
+                delivery = Delivery.objects.create(supplier=supplier, delivery_date=day)
+                DeliveryItem.objects.create(delivery=delivery, product=self.product,
+                                            quantity_received=quantity, price_per_unit=Decimal(price))
+
+    def test_grouped_volumes_and_costs(self):
+        rows = analytics.get_report('volumes', date(2025, 1, 1), date(2025, 2, 1))
+        acme_jan = rows[0]
+        self.assertEqual((acme_jan['month'], acme_jan['supplier_id']), (date(2025, 1, 1), self.acme.pk))
+        self.assertEqual((acme_jan['deliveries'], acme_jan['quantity']), (2, 40))
+        self.assertEqual(Decimal(acme_jan['amount']), Decimal('110'))
+        self.assertEqual(len(rows), 3)
+
+        costs = analytics.get_report('unit-costs', date(2025, 1, 1), date(2025, 1, 1))
+        self.assertEqual(Decimal(costs[0]['avg_unit_cost']), Decimal('2.75'))
+        self.assertEqual((costs[0]['min_price'], costs[0]['max_price']), (Decimal('2.00'), Decimal('3.00')))
+
+    def test_lead_times(self):
+        delivery = Delivery.objects.filter(supplier=self.beta).get()
+        unit = ProductUnit.objects.create(product=self.product, serial_number='A1-1', status='in_supply')
+        ProductUnit.objects.filter(pk=unit.pk).update(created_at=timezone.make_aware(datetime(2025, 1, 5, 12)))
+        receive_units(delivery, ['A1-1'])
+
+        rows = analytics.get_report('lead-times', date(2025, 1, 1), date(2025, 1, 1))
+        self.assertEqual(rows[0]['units'], 1)
+        self.assertEqual(rows[0]['avg_lead_days'], 10.0)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cached_per_month_and_invalidated_by_change(self):
+        # Число запросов - к данным; общий DatabaseCache добавил бы свои
+        cache.clear()
+        analytics.get_report('volumes', date(2025, 1, 1), date(2025, 2, 1))
+        with self.assertNumQueries(0):
+            analytics.get_report('volumes', date(2025, 1, 1), date(2025, 2, 1))
+
+        item = DeliveryItem.objects.get(delivery__delivery_date=date(2025, 2, 5))
+        item.quantity_received = 7
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+        # Январь остался в кеше, февраль пересчитывается
+        with self.assertNumQueries(1):
+            rows = analytics.get_report('volumes', date(2025, 1, 1), date(2025, 2, 1))
+        self.assertEqual(rows[-1]['quantity'], 7)
+
+    def test_version_expires_after_invalidation(self):
+        analytics.get_report('volumes', date(2025, 2, 1), date(2025, 2, 1))
+        key = analytics.VERSION_KEY.format(month='2025-02')
+        analytics.invalidate(date(2025, 2, 5))
+        self.assertIsNotNone(cache.get(key))
+        later = timezone.now() + timedelta(seconds=analytics.VERSION_TIMEOUT + 60)
+        with mock.patch('django.core.cache.backends.db.tz_now', return_value=later - timedelta(seconds=120)):
+            self.assertIsNotNone(cache.get(key))
+        with mock.patch('django.core.cache.backends.db.tz_now', return_value=later):
+            self.assertIsNone(cache.get(key))
+
+    def test_moving_delivery_invalidates_both_months(self):
+        analytics.get_report('volumes', date(2025, 1, 1), date(2025, 2, 1))
+        delivery = Delivery.objects.get(delivery_date=date(2025, 2, 5))
+        delivery.delivery_date = date(2025, 1, 25)
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.save()
+
+        rows = analytics.get_report('volumes', date(2025, 1, 1), date(2025, 2, 1))
+        self.assertEqual([row['month'].month for row in rows], [1, 1])
+        self.assertEqual(rows[0]['deliveries'], 3)
+
+    def test_endpoint_and_export(self):
+        url = reverse('supplier-analytics', args=['volumes'])
+        response = self.client.get(url, {'start': '2025-01', 'end': '2025-02', 'supplier': self.beta.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['quantity'] for row in response.json()['results']], [5])
+        self.assertEqual(self.client.get(url, {'start': 'январь'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('supplier-analytics', args=['nope'])).status_code, 404)
+
+        out = StringIO()
+        call_command('export_supplier_analytics', 'unit-costs', '--start', '2025-01', '--end', '2025-02', stdout=out)
+        lines = out.getvalue().strip().splitlines()
+        self.assertIn('avg_unit_cost', lines[0])
+        self.assertEqual(len(lines), 4)
@@ -0,0 +1,9 @@
+#  app deliveries\urls
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.delivery_list, name='delivery-list'),
+    path('analytics/<slug:report>/', views.supplier_analytics, name='supplier-analytics'),
+    path('<int:pk>/receive/', views.delivery_receive, name='delivery-receive'),
+]
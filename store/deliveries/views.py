@@ -1,3 +1,101 @@
-from django.shortcuts import render
+import json
+from datetime import date
 
-# Create your views here.
+from django.http import JsonResponse
+from django.utils import timezone
+
+from product.api_auth import api_token_required
+from product.pagination import after_cursor, decode_cursor, page, parse_limit
+
+from . import analytics
+from .models import Delivery
+from .receiving import MAX_SCAN_BATCH, receive_units
+
+DEFAULT_ANALYTICS_MONTHS = 12
+LIST_FIELDS = (
+    'id', 'supplier_id', 'supplier__name', 'delivery_date', 'total_amount',
+    'items_total', 'items_count',
+)
+
+
+def delivery_list(request):
+    """
+    Поставки от новых к старым с суммами позиций из одного агрегирующего
+    запроса. ?supplier=id, ?limit=N, ?cursor=... - keyset по (delivery_date, id).
+    """
+    queryset = Delivery.objects.with_totals().order_by('-delivery_date', '-pk')
+    try:
+        if request.GET.get('supplier'):
+            queryset = queryset.filter(supplier_id=int(request.GET['supplier']))
+        if request.GET.get('cursor'):
+            queryset = after_cursor(
+                queryset, ('delivery_date', 'pk'),
+                decode_cursor(request.GET['cursor'], (date, int)), descending=True,
+            )
+        limit = parse_limit(request.GET.get('limit'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    rows, next_cursor = page(queryset.values(*LIST_FIELDS), limit, ('delivery_date', 'id'))
+    return JsonResponse({'results': rows, 'next_cursor': next_cursor})
+
+
+@api_token_required
+def delivery_receive(request, pk):
+    """
+    Приемка поставки сканером: {"serials": [...]} -> какие единицы приняты,
+    какие уже были приняты, неизвестны, не относятся к поставке или
+    находятся в неподходящем статусе, плюс новая сумма поставки.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not Delivery.objects.filter(pk=pk).exists():
+        return JsonResponse({'error': 'Not found'}, status=404)
+
+    try:
+        serials = json.loads(request.body)['serials']
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'Ожидается {"serials": [...]}'}, status=400)
+    if not isinstance(serials, list):
+        return JsonResponse({'error': 'Ожидается {"serials": [...]}'}, status=400)
+    if len(serials) > MAX_SCAN_BATCH:
+        return JsonResponse({'error': f'Не более {MAX_SCAN_BATCH} серийных номеров за запрос'}, status=400)
+
+    return JsonResponse(receive_units(pk, serials).as_dict())
+
+
+def _parse_month(value):
+    """YYYY-MM -> первое число месяца"""
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise ValueError(f'Ожидается месяц в формате YYYY-MM: {value}')
+
+
+def supplier_analytics(request, report):
+    """
+    Аналитика закупок: ?start=YYYY-MM&end=YYYY-MM (по умолчанию - последние
+    12 месяцев), ?supplier=id сужает выдачу до одного поставщика.
+    """
+    if report not in analytics.REPORTS:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    try:
+        end = _parse_month(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        if request.GET.get('start'):
+            start = _parse_month(request.GET['start'])
+        else:
+            index = end.year * 12 + end.month - DEFAULT_ANALYTICS_MONTHS
+            start = date(index // 12, index % 12 + 1, 1)
+        supplier = int(request.GET['supplier']) if request.GET.get('supplier') else None
+        rows = analytics.get_report(report, start, end)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if supplier is not None:
+        rows = [row for row in rows if row['supplier_id'] == supplier]
+    return JsonResponse({
+        'start': analytics.month_start(start),
+        'end': analytics.month_start(end),
+        'results': rows,
+    })
@@ -37,7 +37,7 @@ class ProductImageAdmin(admin.ModelAdmin):
             return format_html(
                 '<img src="{}" style="max-height: 100px; max-width: 100px; '
                 'border: 1px solid #ddd; border-radius: 4px;"/>',
-                obj.image.url
+                obj.thumbnail_url(100)
             )
         return "Нет изображения"
     image_preview.short_description = 'Превью'
@@ -0,0 +1,146 @@
+# app files/content
+"""
+Адресация файлов изображений по содержимому.
+
+Файл хранится один раз под именем из SHA-256 его содержимого:
+    products/<aa>/<bb>/<sha256>.<ext>
+сколько бы ProductImage на него ни ссылалось. Число ссылок ведет StoredImage;
+когда оно доходит до нуля, файл, его превью и сама запись удаляются после
+фиксации транзакции.
+
+Хеш считается потоково по чанкам загруженного файла, целиком в память
+файл не читается.
+"""
+import hashlib
+import posixpath
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import thumbnails
+
+HASH_CHUNK_SIZE = 64 * 1024
+CONTENT_DIR = 'products'
+
+
+def hash_file(file):
+    """(sha256 hex, размер в байтах) для файлового объекта, чтение по чанкам"""
+    digest = hashlib.sha256()
+    size = 0
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    chunks = file.chunks(HASH_CHUNK_SIZE) if hasattr(file, 'chunks') else iter(
+        lambda: file.read(HASH_CHUNK_SIZE), b''
+    )
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return digest.hexdigest(), size
+
+
+def content_name(digest, filename):
+    """Имя файла в хранилище по хешу; расширение берется от исходного имени"""
+    ext = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(CONTENT_DIR, digest[:2], digest[2:4], f'{digest}{ext}')
+
+
+def acquire(storage, file, filename):
+    """
+    Регистрирует ссылку на содержимое file и возвращает имя файла в хранилище.
+    Файл записывается до того, как на него появляется ссылка, и только если
+    такого содержимого еще нет.
+    """
+    from .models import StoredImage
+
+    digest, size = hash_file(file)
+    name = StoredImage.objects.filter(sha256=digest).values_list('name', flat=True).first()
+    name = name or content_name(digest, filename)
+    # При откате транзакции вызывающего остается файл без ссылок, но не ссылка
+    # без файла; следующая загрузка того же содержимого его переиспользует
+    write_file(storage, name, file)
+
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(sha256=digest).first()
+        if stored is None:
+            try:
+                with transaction.atomic():
+                    StoredImage.objects.create(sha256=digest, name=name, size=size)
+            except IntegrityError:
+                # Тот же файл параллельно загружен другой транзакцией
+                pass
+            stored = StoredImage.objects.select_for_update().get(sha256=digest)
+        StoredImage.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') + 1)
+        # Под блокировкой строки delete_file не удалит файл; если он успел
+        # удалить его раньше, файл записывается заново
+        write_file(storage, stored.name, file)
+
+    if stored.name != name and storage.exists(name):
+        # Содержимое уже хранится под другим именем - лишняя копия не нужна
+        storage.delete(name)
+    return stored.name
+
+
+def acquire_name(name):
+    """
+    Регистрирует ссылку на уже сохраненный файл name (имя присвоено полю
+    напрямую, без загрузки). Файлы без StoredImage не учитываются, как и в release().
+    """
+    from .models import StoredImage
+
+    if name:
+        StoredImage.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+def write_file(storage, name, file):
+    """Записывает file под именем name, если такого файла еще нет"""
+    if storage.exists(name):
+        return
+    saved = storage.save(name, file)
+    if saved != name:
+        # Параллельная запись того же содержимого - оставляем одну копию
+        storage.delete(saved)
+
+
+def release(storage, name):
+    """Снимает одну ссылку на файл name; последняя ссылка удаляет файл после commit"""
+    from .models import StoredImage
+
+    if not name:
+        return
+    with transaction.atomic():
+        tracked = StoredImage.objects.filter(name=name).update(ref_count=F('ref_count') - 1)
+        orphaned = tracked and StoredImage.objects.filter(name=name, ref_count__lte=0).exists()
+    if orphaned:
+        transaction.on_commit(lambda: delete_file(storage, name))
+    elif not tracked:
+        # Файл без StoredImage (загружен до адресации по содержимому) остается,
+        # но его превью больше не нужны
+        transaction.on_commit(lambda: delete_unused_thumbnails(storage, name))
+
+
+def delete_file(storage, name):
+    """
+    Удаляет файл, его превью и запись StoredImage, если на него снова не сослались.
+    Строка заблокирована до конца удаления: acquire того же содержимого ждет
+    и затем записывает файл заново.
+    """
+    from .models import StoredImage
+
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(name=name, ref_count__lte=0).first()
+        if stored is None:
+            return
+        stored.delete()
+        if storage.exists(name):
+            storage.delete(name)
+        thumbnails.delete_thumbnails(storage, name)
+
+
+def delete_unused_thumbnails(storage, name):
+    """Удаляет превью файла name, если на него не ссылается ни одно изображение"""
+    from .models import ProductImage
+
+    if not ProductImage.objects.filter(image=name).exists():
+        thumbnails.delete_thumbnails(storage, name)
@@ -0,0 +1,87 @@
+# app files/ingest
+"""
+Массовая загрузка изображений товаров из каталога.
+
+Файл относится к товару, если код товара совпадает с именем его папки,
+именем файла или именем файла до последнего '_' / '-':
+    photos/ABC-1/front.jpg, photos/ABC-1.jpg, photos/ABC-1_2.jpg -> товар ABC-1
+
+inspect_file() выполняется в рабочих процессах: потоково считает SHA-256,
+проверяет и декодирует изображение и строит превью. Запись в хранилище
+и в БД - в родительском процессе, пачками.
+"""
+import hashlib
+import os
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from . import thumbnails
+from .content import HASH_CHUNK_SIZE
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+IMAGE_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+
+def find_images(root):
+    """Пути файлов изображений в дереве root, в стабильном порядке"""
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(directory, filename)
+
+
+def code_candidates(path):
+    """Возможные коды товара для файла, от более точного к менее точному"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    candidates = [stem]
+    for separator in ('_', '-'):
+        if separator in stem:
+            candidates.append(stem.rsplit(separator, 1)[0])
+    candidates.append(os.path.basename(os.path.dirname(path)))
+    return [code for code in dict.fromkeys(candidates) if code]
+
+
+def inspect_file(path):
+    """
+    Задача рабочего процесса: хеш, проверка и превью одного файла.
+    Возвращает словарь; при ошибке - {'path', 'error'}.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        with Image.open(path) as image:
+            image_format = image.format
+            image.verify()
+        if image_format not in IMAGE_FORMATS:
+            return {'path': path, 'error': f'неподдерживаемый формат {image_format}'}
+        renditions = thumbnails.render_thumbnails(path)
+    except thumbnails.RENDER_ERRORS as e:
+        return {'path': path, 'error': str(e) or e.__class__.__name__}
+    return {'path': path, 'sha256': digest.hexdigest(), 'size': size, 'renditions': renditions}
+
+
+@dataclass
+class IngestStats:
+    found: int = 0
+    unmatched: int = 0
+    invalid: int = 0
+    duplicates: int = 0
+    created: int = 0
+    stored_files: int = 0
+    bytes_read: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def images_per_sec(self):
+        return self.found / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mb_per_sec(self):
+        return self.bytes_read / 1024 / 1024 / self.elapsed if self.elapsed else 0.0
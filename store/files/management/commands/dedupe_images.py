@@ -0,0 +1,114 @@
+from collections import defaultdict
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from files import content, thumbnails
+from files.models import ProductImage, StoredImage
+
+DELETE_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Move product images to content-addressed names, merge duplicates and rebuild reference counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many bytes deduplication would save'
+        )
+
+    def handle(self, *args, **options):
+        storage = ProductImage._meta.get_field('image').storage
+        dry_run = options['dry_run']
+
+        # sha256 -> [(имя, число ссылок, размер)]; каждый файл читается потоково
+        by_digest = defaultdict(list)
+        missing = 0
+        rows = (
+            ProductImage.objects.exclude(image='')
+            .values('image').annotate(refs=Count('pk')).order_by('image')
+            .iterator()
+        )
+        for row in rows:
+            name = row['image']
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Missing file: {name}')
+                continue
+            with storage.open(name, 'rb') as f:
+                digest, size = content.hash_file(f)
+            by_digest[digest].append((name, row['refs'], size))
+
+        files_before = sum(len(files) for files in by_digest.values())
+        bytes_before = sum(size for files in by_digest.values() for _, _, size in files)
+        bytes_after = sum(files[0][2] for files in by_digest.values())
+
+        if not dry_run:
+            for digest, files in by_digest.items():
+                self.merge(storage, digest, files)
+            self.drop_stale_records(storage, set(by_digest))
+
+        verb = 'would be saved' if dry_run else 'saved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{files_before} files, {len(by_digest)} unique, {missing} missing; '
+            f'{bytes_before - bytes_after} bytes {verb} '
+            f'({(bytes_before - bytes_after) / 1024 / 1024:.1f} MB)'
+        ))
+
+    def merge(self, storage, digest, files):
+        """Оставляет одну копию под именем по хешу и переводит на нее все ссылки"""
+        target = content.content_name(digest, files[0][0])
+        old_names = [name for name, _, _ in files if name != target]
+
+        with transaction.atomic():
+            if not storage.exists(target):
+                with storage.open(files[0][0], 'rb') as f:
+                    storage.save(target, f)
+            if old_names:
+                ready = all(
+                    storage.exists(thumbnails.thumbnail_name(target, size))
+                    for size in thumbnails.THUMBNAIL_SIZES
+                )
+                ProductImage.objects.filter(image__in=old_names).update(
+                    image=target, thumbnails_ready=ready
+                )
+            StoredImage.objects.update_or_create(
+                sha256=digest,
+                defaults={
+                    'name': target,
+                    'size': files[0][2],
+                    'ref_count': sum(refs for _, refs, _ in files),
+                },
+            )
+            transaction.on_commit(lambda: self.delete_files(storage, old_names))
+
+    @staticmethod
+    def delete_files(storage, names):
+        for name in names:
+            if storage.exists(name):
+                storage.delete(name)
+            thumbnails.delete_thumbnails(storage, name)
+
+    def drop_stale_records(self, storage, digests):
+        """Записи StoredImage, на файлы которых больше никто не ссылается, вместе с файлами"""
+        stale = [
+            (pk, name) for pk, digest, name in StoredImage.objects.values_list('pk', 'sha256', 'name').iterator()
+            if digest not in digests
+        ]
+        for start in range(0, len(stale), DELETE_BATCH_SIZE):
+            batch = stale[start:start + DELETE_BATCH_SIZE]
+            names = [name for _, name in batch]
+            # Файл без читаемого содержимого, на который еще ссылаются, не удаляется
+            referenced = set(
+                ProductImage.objects.filter(image__in=names).values_list('image', flat=True)
+            )
+            unused = [name for name in names if name not in referenced]
+            with transaction.atomic():
+                StoredImage.objects.filter(pk__in=[pk for pk, _ in batch]).delete()
+                transaction.on_commit(partial(self.delete_files, storage, unused))
+            for name in unused:
+                self.stdout.write(f'Removed unused file: {name}')
@@ -0,0 +1,76 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from files import thumbnails
+from files.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Build WebP thumbnails for product images in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild thumbnails for every image, not only the backlog'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes (default: CPU count)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Images handed to the pool at a time (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProductImage.objects.exclude(image='')
+        if not options['all']:
+            queryset = queryset.filter(thumbnails_ready=False)
+        storage = ProductImage._meta.get_field('image').storage
+
+        started = time.monotonic()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for batch in self.batches(queryset, options['batch_size']):
+                names = dict(batch)
+                jobs = [(pk, thumbnails.read_source(storage, name)) for pk, name in batch]
+                ready = []
+                # Декодирование и масштабирование - в рабочих процессах,
+                # запись в хранилище и БД - здесь
+                for pk, renditions in pool.map(thumbnails.render_job, jobs, chunksize=8):
+                    if renditions is None:
+                        failed += 1
+                        self.stderr.write(f'Image {pk}: cannot decode {names[pk]}')
+                        continue
+                    thumbnails.save_thumbnails(storage, names[pk], renditions)
+                    ready.append(pk)
+                ProductImage.objects.filter(pk__in=ready).update(thumbnails_ready=True)
+                done += len(ready)
+
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Thumbnails built for {done} images ({failed} failed) in {elapsed:.1f}s, {rate:.1f} images/s'
+        ))
+
+    @staticmethod
+    def batches(queryset, size):
+        """Пачки (pk, имя файла) по возрастанию pk - keyset, а не открытый курсор,
+        т.к. между пачками обновляется thumbnails_ready тех же строк"""
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'image')[:size]
+            )
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1][0]
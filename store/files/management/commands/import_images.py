@@ -0,0 +1,188 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from files import ingest, thumbnails
+from files.content import content_name, write_file
+from files.models import ProductImage, StoredImage
+from product.models import Product
+
+LOOKUP_CHUNK_SIZE = 5000
+INSERT_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Import product images from a directory tree, matching files to Product.code'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory to scan recursively')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes for decoding and thumbnails (default: CPU count)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Files per database batch (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        root = options['directory']
+        if not os.path.isdir(root):
+            raise CommandError(f'Not a directory: {root}')
+
+        stats = ingest.IngestStats()
+        started = time.monotonic()
+        storage = ProductImage._meta.get_field('image').storage
+
+        paths = list(ingest.find_images(root))
+        stats.found = len(paths)
+        products = self.match_products(paths)
+        matched = [path for path in paths if path in products]
+        stats.unmatched = len(paths) - len(matched)
+        for path in paths:
+            if path not in products:
+                self.stderr.write(f'No product for {path}')
+
+        # Товары, у которых главное изображение уже есть (в БД или в этом импорте)
+        self.with_main = set()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(matched), options['batch_size']):
+                batch = matched[start:start + options['batch_size']]
+                results = list(pool.map(ingest.inspect_file, batch, chunksize=4))
+                self.store_batch(storage, results, products, stats)
+
+        stats.elapsed = time.monotonic() - started
+        for path, error in stats.errors:
+            self.stderr.write(f'Invalid image {path}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats.found} files: {stats.created} images created, {stats.stored_files} new files stored, '
+            f'{stats.duplicates} duplicates, {stats.unmatched} unmatched, {stats.invalid} invalid '
+            f'in {stats.elapsed:.1f}s ({stats.images_per_sec:.1f} files/s, {stats.mb_per_sec:.1f} MB/s)'
+        ))
+
+    def match_products(self, paths):
+        """path -> (product_id, code); все коды ищутся пачками IN, а не по файлу"""
+        candidates = {path: ingest.code_candidates(path) for path in paths}
+        codes = sorted({code for found in candidates.values() for code in found})
+        known = {}
+        for start in range(0, len(codes), LOOKUP_CHUNK_SIZE):
+            known.update(
+                Product.objects.filter(code__in=codes[start:start + LOOKUP_CHUNK_SIZE])
+                .order_by().values_list('code', 'pk')
+            )
+        matches = {}
+        for path, found in candidates.items():
+            for code in found:
+                if code in known:
+                    matches[path] = (known[code], code)
+                    break
+        return matches
+
+    def store_batch(self, storage, results, products, stats):
+        valid = []
+        for result in results:
+            if 'error' in result:
+                stats.invalid += 1
+                stats.errors.append((result['path'], result['error']))
+            else:
+                valid.append(result)
+                stats.bytes_read += result['size']
+        if not valid:
+            return
+
+        digests = {}
+        for result in valid:
+            digests.setdefault(result['sha256'], result)
+
+        written = []
+        try:
+            with transaction.atomic():
+                created = self.store_records(storage, valid, digests, products, stats, written)
+        except Exception:
+            # Откат: записанные этой пачкой файлы ни на что не ссылаются
+            for name in written:
+                storage.delete(name)
+                thumbnails.delete_thumbnails(storage, name)
+            raise
+        stats.stored_files += len(written)
+        stats.created += created
+
+    def store_records(self, storage, valid, digests, products, stats, written):
+        """
+        Записи StoredImage и ProductImage одной пачки, затем файлы - под
+        блокировкой строк StoredImage, как в files.content.acquire.
+        Возвращает число созданных ProductImage; имена записанных
+        оригиналов добавляются в written.
+        """
+        # Одно содержимое - одна запись; параллельная загрузка того же
+        # содержимого (например, из админки) не прерывает импорт
+        StoredImage.objects.bulk_create(
+            [
+                StoredImage(sha256=digest, name=content_name(digest, result['path']), size=result['size'])
+                for digest, result in digests.items()
+            ],
+            batch_size=INSERT_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        names = dict(
+            StoredImage.objects.select_for_update().filter(sha256__in=list(digests))
+            .values_list('sha256', 'name')
+        )
+
+        # Главное изображение: не больше одного на товар, с учетом уже загруженных
+        product_ids = {products[result['path']][0] for result in valid}
+        self.with_main |= set(
+            ProductImage.objects.filter(product_id__in=product_ids - self.with_main, is_main=True)
+            .order_by().values_list('product_id', flat=True)
+        )
+        existing = set(
+            ProductImage.objects.filter(product_id__in=product_ids, image__in=set(names.values()))
+            .order_by().values_list('product_id', 'image')
+        )
+
+        rows = []
+        refs = Counter()
+        for result in valid:
+            product_id, code = products[result['path']]
+            name = names[result['sha256']]
+            if (product_id, name) in existing:
+                stats.duplicates += 1
+                continue
+            existing.add((product_id, name))
+            is_main = product_id not in self.with_main
+            self.with_main.add(product_id)
+            rows.append(ProductImage(
+                product_id=product_id, code=code, image=name, is_main=is_main, thumbnails_ready=True
+            ))
+            refs[result['sha256']] += 1
+
+        if refs:
+            by_count = {}
+            for digest, count in refs.items():
+                by_count.setdefault(count, []).append(digest)
+            StoredImage.objects.filter(sha256__in=list(refs)).update(ref_count=F('ref_count') + Case(
+                *[When(sha256__in=group, then=Value(count)) for count, group in by_count.items()],
+                output_field=IntegerField(),
+            ))
+        ProductImage.objects.bulk_create(rows, batch_size=INSERT_BATCH_SIZE)
+
+        # Файлы: уже известные не пишутся повторно
+        for digest, result in digests.items():
+            name = names[digest]
+            if not storage.exists(name):
+                with open(result['path'], 'rb') as f:
+                    write_file(storage, name, File(f))
+                written.append(name)
+            if not storage.exists(thumbnails.thumbnail_name(name, thumbnails.THUMBNAIL_SIZES[0])):
+                thumbnails.save_thumbnails(storage, name, result['renditions'])
+        return len(rows)
@@ -1,11 +1,55 @@
 # app files/models
-from django.db import models
+from django.db import models, transaction
+from django.db.models.fields.files import ImageFieldFile
 from django.conf import settings
-import os
 
-def product_image_upload_path(instance, filename):
-    """Генерирует путь для сохранения изображений товаров"""
-    return os.path.join('products', instance.product.code, filename)
+from . import content, thumbnails
+
+
+class ContentAddressedFieldFile(ImageFieldFile):
+    """
+    Имя файла - по хешу его содержимого (см. files.content): и при сохранении
+    модели с новым файлом, и при image.save(name, file) напрямую
+    """
+
+    def save(self, name, file, save=True):
+        previous = self.name if self._committed else None
+        self.name = content.acquire(self.storage, file, name)
+        if self.name == previous:
+            # То же содержимое, что уже сохранено: лишняя ссылка не нужна
+            content.release(self.storage, previous)
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        # Ссылка уже взята: ProductImage.save не должен брать ее повторно
+        self.instance._acquired_image_name = self.name
+        if save:
+            self.instance.save()
+
+    save.alters_data = True
+
+
+class ContentAddressedImageField(models.ImageField):
+    attr_class = ContentAddressedFieldFile
+
+
+class StoredImage(models.Model):
+    """
+    Файл изображения в хранилище и число ProductImage, которые на него ссылаются
+    """
+    sha256 = models.CharField('SHA-256', max_length=64, unique=True)
+    name = models.CharField('Файл', max_length=255, unique=True)
+    size = models.PositiveBigIntegerField('Размер, байт')
+    ref_count = models.IntegerField('Ссылок', default=0)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        app_label = 'files'
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
 
 class ProductImage(models.Model):
     """
@@ -17,8 +61,8 @@ class ProductImage(models.Model):
         related_name='product_images',
         verbose_name='Товар'
     )
-    image = models.ImageField(
-        upload_to=product_image_upload_path,
+    image = ContentAddressedImageField(
+        upload_to=content.CONTENT_DIR,
         verbose_name='Изображение'
     )
     code = models.CharField(
@@ -34,6 +78,12 @@ class ProductImage(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    thumbnails_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        db_index=True,
+        verbose_name='Превью построены'
+    )
 
     class Meta:
         app_label = 'files'
@@ -44,8 +94,55 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"Изображение {self.id} для товара {self.product.code}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имя файла из БД: превью перестраиваются только при замене файла
+        instance._saved_image_name = instance.__dict__.get('image')
+        return instance
+
     def save(self, *args, **kwargs):
         # Автоматически устанавливаем code равным коду товара
         if not self.code:
             self.code = self.product.code
-        super().save(*args, **kwargs)
\ No newline at end of file
+        old_name = getattr(self, '_saved_image_name', None)
+        image_changed = self.image.name != old_name
+        storage = self.image.storage
+
+        with transaction.atomic():
+            if image_changed:
+                if self.image and not self.image._committed:
+                    # Новый файл: пишется, только если такого содержимого еще нет
+                    self.image.save(self.image.name, self.image.file, save=False)
+                if self.image and getattr(self, '_acquired_image_name', None) != self.image.name:
+                    # Имя уже сохраненного файла, например другого изображения
+                    content.acquire_name(self.image.name)
+                # Превью того же содержимого уже могли построить для другого товара
+                self.thumbnails_ready = bool(self.image) and ProductImage.objects.filter(
+                    image=self.image.name, thumbnails_ready=True
+                ).exists()
+            super().save(*args, **kwargs)
+            if image_changed and old_name:
+                content.release(storage, old_name)
+        self._saved_image_name = self.image.name
+        self._acquired_image_name = None
+
+        if image_changed and self.image and not self.thumbnails_ready:
+            self.thumbnails_ready = thumbnails.generate_thumbnails(self)
+            if self.thumbnails_ready:
+                ProductImage.objects.filter(pk=self.pk).update(thumbnails_ready=True)
+
+    def thumbnail_url(self, size):
+        """URL превью размера size; пока превью не построены - URL оригинала"""
+        return thumbnail_url(self.image.name, size, self.thumbnails_ready, self.image.storage)
+
+
+def thumbnail_url(image_name, size, ready, storage=None):
+    """
+    URL превью по имени оригинала - для списков, где есть только
+    аннотированные путь и флаг готовности, без экземпляра ProductImage
+    """
+    if size not in thumbnails.THUMBNAIL_SIZES:
+        raise ValueError(f'Размер превью должен быть одним из: {thumbnails.THUMBNAIL_SIZES}')
+    storage = storage or ProductImage._meta.get_field('image').storage
+    return storage.url(thumbnails.thumbnail_name(image_name, size) if ready else image_name)
\ No newline at end of file
@@ -0,0 +1,12 @@
+# files/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import content
+from .models import ProductImage
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_image_file(sender, instance, **kwargs):
+    """Удаление изображения снимает ссылку на файл; последняя - удаляет его"""
+    content.release(instance.image.storage, instance.image.name)
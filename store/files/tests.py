@@ -1,3 +1,336 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image, JpegImagePlugin
+
+from product.models import Product
+
+from .content import hash_file
+from .models import ProductImage, StoredImage
+from .thumbnails import generate_thumbnails, render_thumbnails, thumbnail_name
+
+
+def make_image(width=1200, height=800, fmt='JPEG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class MediaTestCase(TestCase):
+    """Файлы пишутся во временный MEDIA_ROOT, удаляемый после каждого теста"""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ThumbnailTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(code='T1', name='Футболка')
+
+    def upload(self, content, name='photo.jpg'):
+        return ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile(name, content), is_main=True
+        )
+
+    def test_renditions_built_on_upload(self):
+        image = self.upload(make_image())
+        self.assertTrue(image.thumbnails_ready)
+        directory, filename = image.image.name.rsplit('/', 1)
+        self.assertEqual(thumbnail_name(image.image.name, 100), f'{directory}/thumbs/{filename}_100.webp')
+
+        storage = image.image.storage
+        for size, expected in ((100, (100, 67)), (400, (400, 267))):
+            with storage.open(thumbnail_name(image.image.name, size)) as f, Image.open(f) as thumb:
+                self.assertEqual((thumb.format, thumb.size), ('WEBP', expected))
+        self.assertTrue(image.thumbnail_url(400).endswith('_400.webp'))
+        with self.assertRaises(ValueError):
+            image.thumbnail_url(123)
+
+    def test_broken_upload_falls_back_to_original(self):
+        image = self.upload(b'not an image', name='broken.jpg')
+        self.assertFalse(ProductImage.objects.get(pk=image.pk).thumbnails_ready)
+        self.assertEqual(image.thumbnail_url(100), image.image.url)
+
+    def test_resave_without_new_file_does_not_rebuild(self):
+        image = ProductImage.objects.get(pk=self.upload(make_image()).pk)
+        storage = image.image.storage
+        storage.delete(thumbnail_name(image.image.name, 100))
+        image.is_main = False
+        image.save()
+        self.assertFalse(storage.exists(thumbnail_name(image.image.name, 100)))
+
+    def test_jpeg_decoded_at_reduced_scale(self):
+        draft = JpegImagePlugin.JpegImageFile.draft
+        with mock.patch.object(JpegImagePlugin.JpegImageFile, 'draft', autospec=True, side_effect=draft) as spy:
+            renditions = render_thumbnails(make_image(3000, 2000))
+        spy.assert_called_once_with(mock.ANY, 'RGB', (400, 400))
+        for size, expected in ((100, (100, 67)), (400, (400, 267))):
+            with Image.open(io.BytesIO(renditions[size])) as thumb:
+                self.assertEqual(thumb.size, expected)
+        # PNG декодируется целиком, draft на нем ничего не меняет
+        with Image.open(io.BytesIO(render_thumbnails(make_image(800, 600, 'PNG'))[400])) as thumb:
+            self.assertEqual(thumb.size, (400, 300))
+
+    def test_same_stem_different_extension_get_own_thumbnails(self):
+        self.assertNotEqual(
+            thumbnail_name('products/T1/photo.jpg', 100), thumbnail_name('products/T1/photo.png', 100)
+        )
+
+    def test_replaced_legacy_file_loses_its_thumbnails(self):
+        # Файл старой раскладки, не учтенный в StoredImage
+        name = default_storage.save('products/T1/photo.jpg', ContentFile(make_image(300, 200)))
+        ProductImage.objects.bulk_create([ProductImage(product=self.product, code='T1', image=name)])
+        image = ProductImage.objects.get()
+        self.assertTrue(generate_thumbnails(image))
+        self.assertTrue(default_storage.exists(thumbnail_name(name, 100)))
+
+        image.image = SimpleUploadedFile('new.jpg', make_image(200, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertFalse(default_storage.exists(thumbnail_name(name, 100)))
+        self.assertFalse(default_storage.exists(thumbnail_name(name, 400)))
+        self.assertTrue(default_storage.exists(thumbnail_name(image.image.name, 100)))
+
+    def test_command_processes_backlog(self):
+        images = [self.upload(make_image(300, 300 + i), name=f'p{i}.png') for i in range(3)]
+        ProductImage.objects.update(thumbnails_ready=False)
+        for image in images:
+            image.image.storage.delete(thumbnail_name(image.image.name, 100))
+
+        out = StringIO()
+        call_command('generate_thumbnails', '--workers', '2', '--batch-size', '2', stdout=out)
+        self.assertIn('Thumbnails built for 3 images', out.getvalue())
+        self.assertEqual(ProductImage.objects.filter(thumbnails_ready=True).count(), 3)
+        self.assertTrue(images[0].image.storage.exists(thumbnail_name(images[0].image.name, 100)))
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.red = Product.objects.create(code='R1', name='Кружка красная')
+        self.blue = Product.objects.create(code='R2', name='Кружка синяя')
+        self.photo = make_image(640, 480)
+
+    def upload(self, product, name='Photo.JPG'):
+        return ProductImage.objects.create(product=product, image=SimpleUploadedFile(name, self.photo))
+
+    def test_same_content_stored_once(self):
+        first = self.upload(self.red)
+        second = self.upload(self.blue, name='other-name.jpg')
+
+        digest, size = hash_file(io.BytesIO(self.photo))
+        self.assertEqual(first.image.name, f'products/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second.image.name, first.image.name)
+        stored = StoredImage.objects.get()
+        self.assertEqual((stored.sha256, stored.size, stored.ref_count), (digest, size, 2))
+        self.assertTrue(second.thumbnails_ready)
+
+    def test_last_reference_removes_file(self):
+        first = self.upload(self.red)
+        second = self.upload(self.blue)
+        storage = first.image.storage
+        name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(thumbnail_name(name, 100)))
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_assigned_name_takes_reference(self):
+        first = self.upload(self.red)
+        storage = first.image.storage
+        second = ProductImage.objects.create(product=self.blue, image=first.image.name)
+        self.assertEqual(StoredImage.objects.get().ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+
+    def test_field_save_on_new_image(self):
+        image = ProductImage(product=self.red)
+        image.image.save('a.jpg', ContentFile(self.photo))
+
+        digest, _ = hash_file(io.BytesIO(self.photo))
+        image.refresh_from_db()
+        self.assertEqual(image.image.name, f'products/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(StoredImage.objects.get(name=image.image.name).ref_count, 1)
+        self.assertTrue(image.thumbnails_ready)
+
+    def test_field_save_replaces_file(self):
+        image = self.upload(self.red)
+        old_name = image.image.name
+        storage = image.image.storage
+
+        image = ProductImage.objects.get(pk=image.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.image.save('b.png', ContentFile(make_image(20, 20, 'PNG')))
+        image.refresh_from_db()
+        stored = StoredImage.objects.get()
+        self.assertEqual((stored.name, stored.ref_count), (image.image.name, 1))
+        self.assertTrue(image.image.name.endswith('.png'))
+        self.assertTrue(storage.exists(image.image.name))
+        self.assertFalse(storage.exists(old_name))
+
+        # Повторное сохранение того же содержимого не добавляет ссылку
+        image.image.save('b.png', ContentFile(make_image(20, 20, 'PNG')))
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+
+    def test_reference_taken_before_pending_delete(self):
+        image = self.upload(self.red)
+        storage = image.image.storage
+        name = image.image.name
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            image.delete()
+        self.upload(self.blue)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+
+    def test_file_deleted_under_reference_is_written_again(self):
+        # Состояние после delete_file, начавшегося до новой ссылки
+        image = self.upload(self.red)
+        storage = image.image.storage
+        StoredImage.objects.update(ref_count=0)
+        storage.delete(image.image.name)
+
+        second = self.upload(self.blue)
+        self.assertEqual(second.image.name, image.image.name)
+        self.assertTrue(storage.exists(second.image.name))
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+
+    def test_failed_write_takes_no_reference(self):
+        storage = ProductImage._meta.get_field('image').storage
+        with mock.patch.object(storage, 'save', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.upload(self.red)
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_dedupe_command_merges_legacy_files(self):
+        # Старая раскладка products/<code>/<filename>: одна фотография в двух копиях
+        for product in (self.red, self.blue):
+            name = default_storage.save(f'products/{product.code}/photo.jpg', ContentFile(self.photo))
+            ProductImage.objects.bulk_create([ProductImage(product=product, code=product.code, image=name)])
+        default_storage.save('products/R1/other.jpg', ContentFile(make_image(10, 10)))
+        ProductImage.objects.bulk_create([ProductImage(product=self.red, code='R1', image='products/R1/other.jpg')])
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_images', stdout=out)
+        self.assertIn(f'3 files, 2 unique, 0 missing; {len(self.photo)} bytes saved', out.getvalue())
+
+        names = set(ProductImage.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 2)
+        self.assertFalse(default_storage.exists('products/R1/photo.jpg'))
+        self.assertEqual(
+            sorted(StoredImage.objects.values_list('ref_count', flat=True)), [1, 2]
+        )
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+
+    def test_dedupe_command_removes_unused_files(self):
+        kept = self.upload(self.red)
+        StoredImage.objects.create(sha256='0' * 64, name='products/00/00/unused.jpg', size=3)
+        default_storage.save('products/00/00/unused.jpg', ContentFile(b'old'))
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_images', stdout=out)
+        self.assertIn('Removed unused file: products/00/00/unused.jpg', out.getvalue())
+        self.assertFalse(default_storage.exists('products/00/00/unused.jpg'))
+        self.assertTrue(default_storage.exists(kept.image.name))
+        self.assertEqual(StoredImage.objects.get().name, kept.image.name)
+
+class ImportImagesTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.shirt = Product.objects.create(code='SH-1', name='Рубашка')
+        self.cap = Product.objects.create(code='CAP', name='Кепка')
+
+    def write(self, relative, content):
+        path = os.path.join(self.source, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def run_import(self):
+        out, err = StringIO(), StringIO()
+        call_command('import_images', self.source, '--workers', '2', '--batch-size', '2',
+                     stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_matches_codes_and_sets_one_main(self):
+        shared = make_image(50, 50)
+        self.write('SH-1.jpg', make_image(60, 40))
+        self.write('SH-1_2.jpg', shared)
+        self.write('CAP/front.png', make_image(30, 30, 'PNG'))
+        self.write('CAP/back.jpg', shared)
+        self.write('UNKNOWN.jpg', make_image(10, 10))
+        self.write('SH-1_3.jpg', b'broken')
+
+        out, err = self.run_import()
+        self.assertIn('6 files: 4 images created, 3 new files stored, 0 duplicates, 1 unmatched, 1 invalid', out)
+        self.assertIn('files/s', out)
+        self.assertIn('UNKNOWN.jpg', err)
+
+        for product in (self.shirt, self.cap):
+            self.assertEqual(product.product_images.filter(is_main=True).count(), 1)
+        self.assertEqual(self.shirt.product_images.count(), 2)
+        self.assertEqual(
+            sorted(StoredImage.objects.values_list('ref_count', flat=True)), [1, 1, 2]
+        )
+        image = self.cap.product_images.get(is_main=False)
+        self.assertTrue(image.image.storage.exists(thumbnail_name(image.image.name, 100)))
+
+    def test_reimport_is_idempotent(self):
+        self.write('SH-1.jpg', make_image(60, 40))
+        self.run_import()
+        out, _ = self.run_import()
+        self.assertIn('0 images created, 0 new files stored, 1 duplicates', out)
+        self.assertEqual(StoredImage.objects.get().ref_count, 1)
+
+    def test_content_uploaded_elsewhere_is_reused(self):
+        # То же содержимое уже загружено через админку под другим расширением
+        photo = make_image(60, 40)
+        uploaded = ProductImage.objects.create(product=self.cap, image=SimpleUploadedFile('cap.jpeg', photo))
+        self.write('SH-1.jpg', photo)
+
+        out, _ = self.run_import()
+        self.assertIn('1 images created, 0 new files stored', out)
+        self.assertEqual(self.shirt.product_images.get().image.name, uploaded.image.name)
+        self.assertEqual(StoredImage.objects.get().ref_count, 2)
+
+    def test_failed_batch_leaves_no_files(self):
+        self.write('SH-1.jpg', make_image(60, 40))
+        with mock.patch('files.thumbnails.save_thumbnails', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.run_import()
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertFalse(ProductImage.objects.exists())
+        stored = [files for _, _, files in os.walk(self.media) if files]
+        self.assertEqual(stored, [])
@@ -0,0 +1,109 @@
+# app files/thumbnails
+"""
+Уменьшенные копии изображений товаров.
+
+Для каждого ProductImage строятся WebP-превью фиксированных размеров
+(по большей стороне) и кладутся рядом с оригиналом:
+    products/<aa>/<bb>/<sha256>.<ext> -> products/<aa>/<bb>/thumbs/<sha256>.<ext>_100.webp
+Расширение оригинала остается в имени, поэтому у файлов старой раскладки
+(products/<code>/photo.jpg и photo.png) превью тоже не совпадают.
+
+render_thumbnails() не обращается ни к БД, ни к хранилищу, поэтому
+выполняется и в процессе запроса, и в рабочих процессах команды
+generate_thumbnails.
+"""
+import io
+import posixpath
+
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = (100, 400)
+THUMBNAIL_FORMAT = 'WEBP'
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_DIR = 'thumbs'
+
+# Ошибки чтения битых или не-графических файлов
+RENDER_ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+
+def thumbnail_name(image_name, size):
+    """
+    Имя файла превью размера size для оригинала image_name:
+    products/<aa>/<bb>/<sha256>.<ext> -> products/<aa>/<bb>/thumbs/<sha256>.<ext>_<size>.webp
+    """
+    directory, filename = posixpath.split(image_name)
+    return posixpath.join(directory, THUMBNAIL_DIR, f'{filename}_{size}.webp')
+
+
+def render_thumbnails(source, sizes=THUMBNAIL_SIZES):
+    """
+    Превью всех размеров из одного декодирования оригинала.
+    source - путь к файлу, bytes или файловый объект. Возвращает {size: bytes}.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with Image.open(source) as original:
+        # JPEG декодируется сразу в уменьшенном масштабе (DCT scaling),
+        # не ниже самого большого превью
+        original.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    renditions = {}
+    # От большего к меньшему: каждый размер уменьшается из предыдущего
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY, method=4)
+        renditions[size] = buffer.getvalue()
+    return renditions
+
+
+def read_source(storage, name):
+    """Путь к оригиналу для локального хранилища, иначе его содержимое"""
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        with storage.open(name, 'rb') as f:
+            return f.read()
+
+
+def save_thumbnails(storage, image_name, renditions):
+    """Записывает превью в хранилище под детерминированными именами"""
+    from django.core.files.base import ContentFile
+
+    for size, content in renditions.items():
+        name = thumbnail_name(image_name, size)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(content))
+
+
+def delete_thumbnails(storage, image_name):
+    for size in THUMBNAIL_SIZES:
+        name = thumbnail_name(image_name, size)
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def generate_thumbnails(image):
+    """
+    Строит и сохраняет превью для ProductImage в текущем процессе.
+    Возвращает False, если оригинал не удалось прочитать как изображение.
+    """
+    storage = image.image.storage
+    try:
+        renditions = render_thumbnails(read_source(storage, image.image.name))
+    except RENDER_ERRORS:
+        return False
+    save_thumbnails(storage, image.image.name, renditions)
+    return True
+
+
+def render_job(job):
+    """Задача рабочего процесса: (pk, source) -> (pk, {size: bytes} или None)"""
+    pk, source = job
+    try:
+        return pk, render_thumbnails(source)
+    except RENDER_ERRORS:
+        return pk, None
@@ -1,17 +1,24 @@
 # app product\admin
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
 from django.utils.html import format_html
-from django.utils.text import slugify
-from .models import Category, Product
+
+from files.models import ProductImage, thumbnail_url
+from .models import Category, Product, allocate_slug
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'parent_link', 'slug_display', 'product_count')
+    list_display = ('name', 'parent_link', 'slug_display', 'product_count', 'tree_product_count')
     list_filter = ('parent',)
+    list_select_related = ('parent',)
     search_fields = ('name',)
     fields = ('name', 'parent')  # slug исключен из формы
 
+    def get_queryset(self, request):
+        # Счетчики товаров считаются в запросе списка, а не по строке
+        return super().get_queryset(request).with_product_counts(include_descendants=True)
+
     # Метод для отображения родительской категории как ссылки
     def parent_link(self, obj):
         if obj.parent:
@@ -26,34 +33,29 @@ class CategoryAdmin(admin.ModelAdmin):
 
     slug_display.short_description = 'ЧПУ'
 
-    # Метод для подсчета товаров в категории
+    # Товары самой категории и вместе с подкатегориями - из аннотаций
     def product_count(self, obj):
-        return obj.products.count()
+        return obj.products_total
 
     product_count.short_description = 'Товаров'
+    product_count.admin_order_field = 'products_total'
 
-    # Метод сохранения модели - ДОЛЖЕН БЫТЬ ВНУТРИ КЛАССА CategoryAdmin
-    def save_model(self, request, obj, form, change):
-        """
-        Автоматическая генерация slug при сохранении.
-        Этот метод должен быть внутри класса CategoryAdmin!
-        """
-        if not obj.slug:
-            base_slug = slugify(obj.name)
-            unique_slug = base_slug
-            counter = 1
+    def tree_product_count(self, obj):
+        return obj.tree_products_total
 
-            # Проверяем уникальность slug
-            while Category.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
+    tree_product_count.short_description = 'С подкатегориями'
+    tree_product_count.admin_order_field = 'tree_products_total'
 
-            obj.slug = unique_slug
+    def save_model(self, request, obj, form, change):
+        """Автоматическая генерация уникального slug при сохранении"""
+        if not obj.slug:
+            obj.slug = allocate_slug(obj.name, exclude_pk=obj.pk)
         super().save_model(request, obj, form, change)
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'code', 'category', 'main_image_preview', 'images_count')
+    list_select_related = ('category',)
     readonly_fields = ('main_image_preview', 'images_list')
     fieldsets = (
         ('Основная информация', {
@@ -68,13 +70,25 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Число изображений и путь главного считаются в запросе списка,
+        # а не отдельными запросами на каждую строку
+        main_image = (
+            ProductImage.objects.filter(product=OuterRef('pk'), is_main=True)
+            .order_by('created_at')
+        )
+        return super().get_queryset(request).annotate(
+            images_total=Count('product_images'),
+            main_image_path=Subquery(main_image.values('image')[:1]),
+            main_image_thumbnails=Subquery(main_image.values('thumbnails_ready')[:1]),
+        )
+
     def main_image_preview(self, obj):
-        main_image = obj.product_images.filter(is_main=True).first()
-        if main_image:
+        if obj.main_image_path:
             return format_html(
                 '<img src="{}" style="max-height: 100px; max-width: 100px; '
                 'border: 1px solid #ddd; border-radius: 4px;"/>',
-                main_image.image.url
+                thumbnail_url(obj.main_image_path, 100, obj.main_image_thumbnails)
             )
         return "Нет главного изображения"
     main_image_preview.short_description = 'Главное изображение'
@@ -84,7 +98,7 @@ class ProductAdmin(admin.ModelAdmin):
         if images:
             return format_html(' '.join(
                 f'<a href="/admin/files/productimage/{img.id}/change/">'
-                f'<img src="{img.image.url}" style="max-height: 50px; margin: 5px; '
+                f'<img src="{img.thumbnail_url(100)}" style="max-height: 50px; margin: 5px; '
                 'border: 1px solid #ddd; border-radius: 3px;"/></a>'
                 for img in images
             ))
@@ -92,5 +106,6 @@ class ProductAdmin(admin.ModelAdmin):
     images_list.short_description = 'Все изображения'
 
     def images_count(self, obj):
-        return obj.product_images.count()
-    images_count.short_description = 'Изобр.'
\ No newline at end of file
+        return obj.images_total
+    images_count.short_description = 'Изобр.'
+    images_count.admin_order_field = 'images_total'
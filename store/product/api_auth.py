@@ -0,0 +1,47 @@
+# app product/api_auth
+"""
+Доступ машинных клиентов (кассы, сканеры) к POST-эндпоинтам API.
+
+У таких клиентов нет сессии и CSRF-cookie, поэтому эндпоинты освобождены
+от проверки CSRF и вместо нее требуют токен устройства в заголовке:
+    Authorization: Token <токен>
+Токены задаются настройкой API_TOKENS (в store.settings - из переменной
+окружения STORE_API_TOKENS через запятую). Без токенов эндпоинты закрыты.
+"""
+import hmac
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+AUTH_SCHEME = 'Token'
+
+
+def request_token(request):
+    """Токен из заголовка Authorization или None"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme != AUTH_SCHEME or not token.strip():
+        return None
+    return token.strip()
+
+
+def valid_token(token):
+    # Сравнение за постоянное время, без раннего выхода на первом отличии
+    return token is not None and any(
+        hmac.compare_digest(token.encode(), known.encode())
+        for known in getattr(settings, 'API_TOKENS', ())
+    )
+
+
+def api_token_required(view):
+    """Эндпоинт для устройств: без CSRF, но только с действующим токеном"""
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not valid_token(request_token(request)):
+            response = JsonResponse({'error': 'Требуется токен устройства'}, status=401)
+            response['WWW-Authenticate'] = AUTH_SCHEME
+            return response
+        return view(request, *args, **kwargs)
+    return wrapper
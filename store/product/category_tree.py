@@ -0,0 +1,78 @@
+# app product/category_tree
+"""
+Дерево категорий для витрины.
+
+Готовое вложенное дерево хранится в кеше под ключом с номером версии.
+Версия увеличивается сигналами после фиксации любого изменения Category,
+поэтому старые записи кеша просто перестают читаться и вытесняются по TTL.
+Кеш должен быть общим для рабочих процессов (см. CACHES в настройках),
+иначе версия, увеличенная в одном процессе, не дойдет до остальных.
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import Category
+
+VERSION_KEY = 'product:category_tree:version'
+TREE_KEY = 'product:category_tree:{version}'
+TREE_TIMEOUT = 60 * 60 * 24
+# Версия живет не дольше дерева; после истечения берется новая от времени
+VERSION_TIMEOUT = TREE_TIMEOUT
+
+
+def get_version():
+    """Текущая версия дерева (без обращения к БД)"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Начальная версия от времени: после вытеснения ключа или перезапуска
+        # клиент со старым ETag не получит ложный 304
+        seed = int(time.time())
+        cache.add(VERSION_KEY, seed, timeout=VERSION_TIMEOUT)
+        version = cache.get(VERSION_KEY, seed)
+    return version
+
+
+def bump_version():
+    """Инвалидация: следующая выдача дерева соберет его заново"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+        cache.incr(VERSION_KEY)
+    # incr не во всех бэкендах сохраняет срок жизни ключа (DatabaseCache
+    # перезаписывает его со сроком по умолчанию)
+    cache.touch(VERSION_KEY, VERSION_TIMEOUT)
+
+
+def etag_for(version):
+    return f'"category-tree-{version}"'
+
+
+def build_tree():
+    """Вложенное дерево из одного запроса по parent"""
+    nodes = {}
+    roots = []
+    rows = Category.objects.order_by('name', 'pk').values('id', 'name', 'slug', 'parent_id')
+    for row in rows:
+        nodes[row['id']] = {
+            'id': row['id'],
+            'name': row['name'],
+            'slug': row['slug'],
+            'children': [],
+        }
+    for row in rows:
+        node = nodes[row['id']]
+        parent = nodes.get(row['parent_id'])
+        (parent['children'] if parent else roots).append(node)
+    return roots
+
+
+def get_tree(version):
+    """Дерево версии version: из кеша или собранное и положенное в кеш"""
+    key = TREE_KEY.format(version=version)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_tree()
+        cache.set(key, tree, timeout=TREE_TIMEOUT)
+    return tree
@@ -0,0 +1,168 @@
+# app product/importers
+"""
+Массовая загрузка товаров из прайс-листов поставщиков (CSV / JSON Lines).
+
+Строки читаются потоком, группируются в пачки и записываются одним
+INSERT ... ON CONFLICT (code) DO UPDATE на пачку. Ошибочные строки
+не прерывают загрузку, а попадают в отчет.
+"""
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+
+from . import search
+from .models import Category, Product
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Поля, которые перезаписываются у существующего товара с тем же code
+UPSERT_UPDATE_FIELDS = ['name', 'description', 'category', 'updated_at']
+
+
+@dataclass
+class ImportResult:
+    """Итоги загрузки"""
+    processed: int = 0
+    saved: int = 0
+    errors: list = field(default_factory=list)  # [(номер строки, сообщение)]
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'saved': self.saved,
+            'errors': [{'line': line, 'error': message} for line, message in self.errors],
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+def read_csv(stream):
+    """Строки CSV с заголовком: code,name,description,category"""
+    yield from csv.DictReader(stream)
+
+
+def read_jsonl(stream):
+    """
+    Строки JSON Lines: по одному объекту на строку.
+    Нераспознанная строка отдается как исключение, чтобы не обрывать чтение.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f'некорректный JSON: {e}')
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def _category_lookup():
+    """
+    Один запрос: два раздельных словаря - id (строкой) -> id и slug -> id.
+    Раздельные, чтобы slug вида '12' не подменял категорию с id 12.
+    """
+    by_pk, by_slug = {}, {}
+    for pk, slug in Category.objects.values_list('pk', 'slug'):
+        by_pk[str(pk)] = pk
+        by_slug[slug] = pk
+    return by_pk, by_slug
+
+
+def _text(row, key):
+    """Значение колонки строкой: в JSON Lines code может прийти числом"""
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _build_product(row, categories):
+    """Проверка строки и сборка несохраненного Product"""
+    code = _text(row, 'code')
+    name = _text(row, 'name')
+    if not code:
+        raise ValueError('не указан code')
+    if not name:
+        raise ValueError('не указано name')
+    if len(code) > Product._meta.get_field('code').max_length:
+        raise ValueError('слишком длинный code')
+    if len(name) > Product._meta.get_field('name').max_length:
+        raise ValueError('слишком длинное name')
+
+    # category_id - только id категории, category - только ее slug
+    by_pk, by_slug = categories
+    category_id = None
+    if _text(row, 'category_id'):
+        category_id = by_pk.get(_text(row, 'category_id'))
+        if category_id is None:
+            raise ValueError(f'категория с id {row["category_id"]!r} не найдена')
+    elif _text(row, 'category'):
+        category_id = by_slug.get(_text(row, 'category'))
+        if category_id is None:
+            raise ValueError(f'категория {row["category"]!r} не найдена')
+
+    return Product(
+        code=code,
+        name=name,
+        description=_text(row, 'description'),
+        category_id=category_id,
+    )
+
+
+def _flush(batch, result):
+    if not batch:
+        return
+    Product.objects.bulk_create(
+        batch.values(),
+        update_conflicts=True,
+        unique_fields=['code'],
+        update_fields=UPSERT_UPDATE_FIELDS,
+    )
+    # bulk_create не отправляет post_save - индекс поиска обновляем сами
+    search.index_products(Product.objects.filter(code__in=list(batch)))
+    result.saved += len(batch)
+    batch.clear()
+
+
+def import_products(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Upsert товаров по уникальному Product.code.
+
+    rows - итерируемое словарей (см. READERS); ошибки отчета нумеруются
+    по строкам данных. Повторы code внутри одной пачки схлопываются,
+    побеждает последняя строка.
+    """
+    result = ImportResult()
+    started = time.monotonic()
+    categories = _category_lookup()
+    batch = {}
+
+    for line, row in enumerate(rows, start=1):
+        result.processed += 1
+        try:
+            if isinstance(row, Exception):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError('ожидался объект')
+            product = _build_product(row, categories)
+        except ValueError as e:
+            result.errors.append((line, str(e)))
+            continue
+
+        batch[product.code] = product
+        if len(batch) >= batch_size:
+            _flush(batch, result)
+
+    _flush(batch, result)
+    result.elapsed = time.monotonic() - started
+    return result
@@ -0,0 +1,58 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importers import DEFAULT_BATCH_SIZE, READERS, import_products
+
+
+class Command(BaseCommand):
+    help = 'Bulk upsert products by code from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Path to the price list file ("-" reads stdin)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Input format (default: guessed from file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows per INSERT ... ON CONFLICT statement (default: {DEFAULT_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or self.guess_format(path)
+        reader = READERS[fmt]
+
+        if path == '-':
+            result = import_products(reader(sys.stdin), batch_size=options['batch_size'])
+        else:
+            try:
+                with open(path, encoding='utf-8', newline='') as f:
+                    result = import_products(reader(f), batch_size=options['batch_size'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f'Row {line}: {message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {result.processed} rows, saved {result.saved}, '
+            f'errors {len(result.errors)} '
+            f'({result.elapsed:.2f}s, {result.rows_per_sec:.0f} rows/sec)'
+        ))
+
+    def guess_format(self, path):
+        ext = os.path.splitext(path)[1].lower().lstrip('.')
+        if ext in READERS:
+            return ext
+        if ext in ('ndjson', 'json'):
+            return 'jsonl'
+        raise CommandError('Cannot guess input format, pass --format')
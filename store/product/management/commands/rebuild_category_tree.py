@@ -0,0 +1,63 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product import category_tree
+from product.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialised category paths from the parent links'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per UPDATE batch (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        nodes = list(Category.objects.only('pk', 'parent_id', 'path'))
+        children = defaultdict(list)
+        for node in nodes:
+            children[node.parent_id].append(node)
+
+        paths = {}
+
+        def walk(roots):
+            stack = [(node, '/') for node in roots]
+            while stack:
+                node, parent_path = stack.pop()
+                paths[node.pk] = f'{parent_path}{node.pk}/'
+                stack.extend(
+                    (child, paths[node.pk]) for child in children[node.pk]
+                    if child.pk not in paths
+                )
+
+        walk(children[None])
+
+        # Узлы, недостижимые от корней, замкнуты в цикл по parent - отцепляем их
+        detached = []
+        for node in nodes:
+            if node.pk not in paths:
+                self.stderr.write(f'Category {node.pk} is part of a parent cycle, detached to root')
+                detached.append(node.pk)
+                walk([node])
+
+        changed = []
+        for node in nodes:
+            if node.path != paths[node.pk]:
+                node.path = paths[node.pk]
+                changed.append(node)
+
+        with transaction.atomic():
+            Category.objects.bulk_update(changed, ['path'], batch_size=options['batch_size'])
+            if detached:
+                Category.objects.filter(pk__in=detached).update(parent=None)
+                transaction.on_commit(category_tree.bump_version)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(nodes)} categories, updated {len(changed)} paths'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Full-text index requires the SQLite backend (FTS5)')
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
@@ -1,15 +1,102 @@
 # app product/models
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Func, Subquery, Value
+from django.db.models.functions import Concat, Length, Substr
 from django.utils import timezone
 from django.utils.text import slugify
 
 
+def subtree_bounds(path):
+    """
+    Границы поддерева для материализованного пути вида '/1/5/'.
+
+    Все пути поддерева начинаются с path, а path оканчивается на '/',
+    следующий за которым символ - '0'. Поэтому поддерево - это диапазон
+    [path, path[:-1] + '0'), который обслуживается обычным B-tree индексом.
+    path может быть строкой или выражением.
+    """
+    if isinstance(path, str):
+        return path, path[:-1] + '0'
+    return path, Concat(Substr(path, 1, Length(path) - 1), Value('0'), output_field=models.CharField())
+
+
+SLUG_MAX_LENGTH = 50
+# Запас под суффикс '-<n>' при обрезке длинных slug
+SLUG_SUFFIX_RESERVE = 8
+
+
+def allocate_slug(name, exclude_pk=None):
+    """
+    Свободный slug для категории: slugify(name), а если он занят - первый
+    свободный вариант 'slug-1', 'slug-2', ... Все занятые варианты читаются
+    одним запросом по префиксу, без проверки кандидатов по одному.
+    """
+    base = slugify(name)[:SLUG_MAX_LENGTH - SLUG_SUFFIX_RESERVE].strip('-') or 'category'
+    taken = Category.objects.filter(slug__startswith=base)
+    if exclude_pk is not None:
+        taken = taken.exclude(pk=exclude_pk)
+    taken = set(taken.values_list('slug', flat=True))
+
+    slug = base
+    counter = 1
+    while slug in taken:
+        slug = f'{base}-{counter}'
+        counter += 1
+    return slug
+
+
+class CategoryQuerySet(models.QuerySet):
+    def descendants_of(self, category, include_self=True):
+        """
+        Категория и все ее потомки одним запросом по индексу path.
+        category - экземпляр Category или pk.
+        """
+        if isinstance(category, Category):
+            path = category.path
+            pk = category.pk
+        else:
+            pk = category
+            path = Subquery(Category.objects.filter(pk=pk).values('path')[:1])
+        lower, upper = subtree_bounds(path)
+        qs = self.filter(path__gte=lower, path__lt=upper)
+        if not include_self:
+            qs = qs.exclude(pk=pk)
+        return qs
+
+    def with_product_counts(self, include_descendants=False):
+        """
+        products_total - товары самой категории (JOIN + GROUP BY);
+        tree_products_total - с товарами всех подкатегорий, коррелированный
+        COUNT по диапазону path для каждой строки.
+        """
+        qs = self.annotate(products_total=models.Count('products'))
+        if include_descendants:
+            lower, upper = subtree_bounds(models.OuterRef('path'))
+            tree_count = (
+                Product.objects.filter(category__path__gte=lower, category__path__lt=upper)
+                .order_by()
+                .annotate(total=Func(F('pk'), function='COUNT'))
+                .values('total')
+            )
+            qs = qs.annotate(tree_products_total=Subquery(tree_count))
+        return qs
+
+
 class Category(models.Model):
     """
     Категория товаров
     """
     name = models.CharField('Название', max_length=255)
     slug = models.SlugField(unique=True, blank=True)
+    # Материализованный путь от корня: '/<id корня>/.../<id>/'
+    path = models.CharField(
+        'Путь в дереве',
+        max_length=255,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
 
     parent = models.ForeignKey(
         'self',
@@ -20,19 +107,84 @@ class Category(models.Model):
         null=True
     )
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         app_label = 'product'
         verbose_name = 'Категория товара'
         verbose_name_plural = 'Категории товаров'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id']),  # keyset-пагинация
+        ]
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+            self.slug = allocate_slug(self.name, exclude_pk=self.pk)
+
+        parent_path = self._parent_path()
+        if parent_path is None:
+            raise ValueError(
+                'У родительской категории не построен path - выполните rebuild_category_tree'
+            )
+        if self._creates_cycle(parent_path):
+            # Формы и админка отсекают это в clean(), сюда доходит только прямой вызов save()
+            raise ValueError('Категорию нельзя вложить в саму себя или в своего потомка')
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._move_subtree(f'{parent_path}{self.pk}/')
+
+    def _parent_path(self):
+        """Путь родителя из БД ('/' для корня); None - у родителя нет пути"""
+        if not self.parent_id:
+            return '/'
+        return Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or None
+
+    def _creates_cycle(self, parent_path):
+        return bool(self.pk) and (
+            self.parent_id == self.pk or bool(self.path and parent_path.startswith(self.path))
+        )
+
+    def clean(self):
+        super().clean()
+        parent_path = self._parent_path()
+        if parent_path is None:
+            raise ValidationError({'parent': 'Дерево категорий не построено: выполните rebuild_category_tree'})
+        if self._creates_cycle(parent_path):
+            raise ValidationError({'parent': 'Категорию нельзя вложить в саму себя или в своего потомка'})
+
+    def _move_subtree(self, new_path):
+        """Записывает новый путь категории и переносит под него всех потомков"""
+        old_path = self.path
+        if new_path == old_path:
+            return
+        Category.objects.filter(pk=self.pk).update(path=new_path)
+        if old_path:
+            lower, upper = subtree_bounds(old_path)
+            Category.objects.filter(path__gt=lower, path__lt=upper).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1))
+            )
+        self.path = new_path
+
+    @property
+    def depth(self):
+        """Уровень вложенности (0 - корень)"""
+        return self.path.count('/') - 2 if self.path else 0
+
+
+class ProductQuerySet(models.QuerySet):
+    def in_category_tree(self, category):
+        """Товары категории и всех ее подкатегорий одним запросом"""
+        if isinstance(category, Category):
+            path = category.path
+        else:
+            path = Subquery(Category.objects.filter(pk=category).values('path')[:1])
+        lower, upper = subtree_bounds(path)
+        return self.filter(category__path__gte=lower, category__path__lt=upper)
 
 
 class Product(models.Model):
@@ -70,11 +222,16 @@ class Product(models.Model):
         verbose_name='Дата последнего обновления'
     )
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         app_label = 'product'
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id']),  # keyset-пагинация
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.code})"
@@ -82,9 +239,10 @@ class Product(models.Model):
     def get_availability_status(self) -> str:
         """
         Возвращает статус доступности товара
-        (заглушка - нужно реализовать логику)
+        по счетчику единиц в магазине (unit.ProductStock)
         """
-        return "В наличии"
+        in_store = self.stock_counters.filter(status='in_store', count__gt=0).exists()
+        return "В наличии" if in_store else "Нет в наличии"
 
     @property
     def images(self):
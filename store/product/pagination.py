@@ -0,0 +1,78 @@
+# app product/pagination
+"""
+Keyset-пагинация списков API.
+
+Курсор - base64 от JSON-массива значений ключа сортировки последней строки
+страницы, например (name, id) или (delivery_date, id). Следующая страница -
+строки строго после этих значений, поэтому глубина страницы не влияет на
+стоимость запроса (нет OFFSET).
+"""
+import base64
+import json
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+
+def encode_cursor(*values):
+    """Кодирует значения ключа сортировки последней строки страницы в курсор"""
+    raw = json.dumps(values, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _from_json(value, type_):
+    if type_ is date:
+        return date.fromisoformat(value)
+    # bool - подкласс int, но в курсоре id недопустим
+    if type(value) is not type_:
+        raise TypeError(type_)
+    return value
+
+
+def decode_cursor(cursor, types):
+    """Разбирает курсор в кортеж значений типов types (str, int, date)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(_from_json(value, type_) for value, type_ in zip(values, types))
+    except (ValueError, TypeError):
+        raise ValueError('Некорректный курсор')
+
+
+def parse_limit(value, default=DEFAULT_PAGE_LIMIT, maximum=MAX_PAGE_LIMIT):
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('limit должен быть положительным')
+    return min(limit, maximum)
+
+
+def after_cursor(queryset, fields, values, descending=False):
+    """
+    Keyset-фильтр по двум полям сортировки: строки строго после values
+    в порядке fields (по убыванию, если descending).
+    """
+    (first, second), (first_value, second_value) = fields, values
+    op = 'lt' if descending else 'gt'
+    return queryset.filter(
+        Q(**{f'{first}__{op}': first_value}) | Q(**{first: first_value, f'{second}__{op}': second_value})
+    )
+
+
+def page(queryset, limit, cursor_fields):
+    """
+    Строки страницы (limit + 1 строка выбирается, чтобы узнать о следующей)
+    и курсор следующей страницы по ключам cursor_fields строки или None.
+    """
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*(rows[-1][key] for key in cursor_fields))
@@ -0,0 +1,127 @@
+# app product/search
+"""
+Полнотекстовый поиск по товарам.
+
+На SQLite индекс - виртуальная таблица FTS5 (rowid = Product.id), которая
+синхронизируется сигналами Product и пересобирается командой
+rebuild_search_index. На прочих СУБД поиск деградирует до icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+INDEX_TABLE = 'product_search'
+INDEX_BATCH_SIZE = 1000
+# Веса bm25 по колонкам индекса: code, name, description
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def ensure_index():
+    """Создает таблицу индекса, если ее еще нет"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+            "code, name, description, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+
+def _index_rows(cursor, rows):
+    rows = list(rows)
+    if not rows:
+        return
+    cursor.executemany(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+    cursor.executemany(
+        f'INSERT INTO {INDEX_TABLE} (rowid, code, name, description) VALUES (%s, %s, %s, %s)',
+        [(pk, code, name, description or '') for pk, code, name, description in rows]
+    )
+
+
+def index_products(queryset):
+    """(Пере)индексирует товары из queryset пачками"""
+    if not is_supported():
+        return
+    rows = queryset.values_list('pk', 'code', 'name', 'description').iterator(chunk_size=INDEX_BATCH_SIZE)
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                _index_rows(cursor, batch)
+                batch = []
+        _index_rows(cursor, batch)
+
+
+def index_product(product):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        _index_rows(cursor, [(product.pk, product.code, product.name, product.description)])
+
+
+def remove_product(pk):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index():
+    """Полная пересборка индекса; возвращает число проиндексированных товаров"""
+    if not is_supported():
+        return 0
+    ensure_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+    index_products(Product.objects.all())
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {INDEX_TABLE}({INDEX_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {INDEX_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def build_match_query(text):
+    """
+    Пользовательский ввод -> выражение MATCH: каждое слово ищется
+    по префиксу, слова объединяются через AND. Кавычки экранируют
+    служебный синтаксис FTS5.
+    """
+    tokens = TOKEN_RE.findall(text)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search(text, limit=20):
+    """Список словарей товаров, отсортированных по релевантности"""
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    if not is_supported():
+        tokens = TOKEN_RE.findall(text)
+        condition = Q()
+        for token in tokens:
+            condition &= Q(code__istartswith=token) | Q(name__icontains=token) | Q(description__icontains=token)
+        return list(Product.objects.filter(condition).values('id', 'code', 'name', 'category_id')[:limit])
+
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    table = Product._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT p.id, p.code, p.name, p.category_id, bm25({INDEX_TABLE}, {weights}) AS score '
+            f'FROM {INDEX_TABLE} JOIN {table} p ON p.id = {INDEX_TABLE}.rowid '
+            f'WHERE {INDEX_TABLE} MATCH %s ORDER BY score LIMIT %s',
+            [match, limit]
+        )
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
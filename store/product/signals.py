@@ -0,0 +1,48 @@
+# product/signals.py
+from django.db import transaction
+from django.db.models.functions import Substr
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import category_tree, search
+from .models import Category, Product, subtree_bounds
+
+
+@receiver(pre_delete, sender=Category)
+def reroot_category_subtree(sender, instance, **kwargs):
+    """
+    parent у детей обнуляется (SET_NULL), поэтому их поддеревья
+    становятся самостоятельными: из путей убирается префикс удаляемой категории.
+    """
+    # Путь читается из БД: при удалении queryset предок из того же набора
+    # мог уже переукоренить поддерево, и instance.path устарел
+    path = Category.objects.filter(pk=instance.pk).values_list('path', flat=True).first()
+    if not path:
+        return
+    lower, upper = subtree_bounds(path)
+    Category.objects.filter(path__gt=lower, path__lt=upper).update(
+        path=Substr('path', len(path))
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    # После commit: иначе параллельный запрос успеет положить в кеш
+    # дерево до изменения под новой версией
+    transaction.on_commit(category_tree.bump_version)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+def create_search_index(sender, using, **kwargs):
+    """Таблица FTS5 не описывается моделью, поэтому создается после migrate"""
+    search.ensure_index()
@@ -1,3 +1,391 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from files.models import ProductImage
+
+from . import category_tree
+from .importers import import_products
+from .models import Category, Product, allocate_slug
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ProductListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Одинаковые имена проверяют сортировку по id внутри имени
+        for i in range(5):
+            Product.objects.create(code=f'P{i}', name='Товар' if i < 3 else f'Товар {i}')
+
+    def test_keyset_pages_cover_all_rows_once(self):
+        url = reverse('product-list')
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(url, params).json()
+            seen.extend(row['code'] for row in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = list(Product.objects.order_by('name', 'pk').values_list('code', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_stream_returns_full_array(self):
+        response = self.client.get(reverse('product-list'), {'stream': '1'})
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 5)
+
+    def test_bad_cursor(self):
+        response = self.client.get(reverse('product-list'), {'cursor': '!!!'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductImportTests(TestCase):
+    def test_upsert_by_code_and_row_errors(self):
+        # slug задан явно: slugify кириллицы пуст
+        category = Category.objects.create(name='Обувь', slug='shoes')
+        Product.objects.create(code='A1', name='Старое имя')
+        rows = [
+            {'code': 'A1', 'name': 'Новое имя', 'category': category.slug},
+            {'code': 'B2', 'name': 'Кеды', 'category_id': category.pk},
+            {'code': '', 'name': 'Без кода'},
+            {'code': 'C3', 'name': 'Сапоги', 'category': 'missing'},
+        ]
+        result = import_products(rows, batch_size=1)
+
+        self.assertEqual(result.processed, 4)
+        self.assertEqual(result.saved, 2)
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertEqual(Product.objects.get(code='A1').name, 'Новое имя')
+        self.assertEqual(Product.objects.get(code='B2').category, category)
+
+    def test_malformed_rows_are_row_errors(self):
+        rows = [
+            {'code': 123, 'name': 'Числовой код'},
+            ['not', 'an', 'object'],
+            {'code': 'D4', 'name': None},
+            {'code': 'D5', 'name': 'Ок'},
+        ]
+        result = import_products(rows, batch_size=1)
+        self.assertEqual(result.saved, 2)
+        self.assertEqual([line for line, _ in result.errors], [2, 3])
+        self.assertTrue(Product.objects.filter(code='123').exists())
+
+    def test_numeric_slug_does_not_shadow_id(self):
+        first = Category.objects.create(name='First')
+        Category.objects.create(name='Second', slug=str(first.pk))
+        import_products([{'code': 'E1', 'name': 'По id', 'category_id': first.pk}])
+        self.assertEqual(Product.objects.get(code='E1').category, first)
+
+    def test_bulk_endpoint_accepts_csv(self):
+        body = 'code,name,description\nX1,Ремень,кожа\nX2,Сумка,\n'
+        response = self.client.post(reverse('product-bulk-import'), body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['saved'], 2)
+        self.assertEqual(Product.objects.get(code='X1').description, 'кожа')
+
+    def test_command_reports_bad_jsonl_lines(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as f:
+            f.write('{"code": "J1", "name": "Шарф"}\n{broken\n{"code": "J2", "name": "Шапка"}\n')
+        self.addCleanup(os.remove, f.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_products', f.name, stdout=out, stderr=err)
+        self.assertIn('saved 2', out.getvalue())
+        self.assertIn('Row 2', err.getvalue())
+        self.assertEqual(Product.objects.filter(code__in=['J1', 'J2']).count(), 2)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name='Clothes')
+        self.shoes = Category.objects.create(name='Shoes', parent=self.root)
+        self.boots = Category.objects.create(name='Boots', parent=self.shoes)
+        self.other = Category.objects.create(name='Accessories')
+
+    def test_paths_and_subtree_query(self):
+        self.assertEqual(self.boots.path, f'/{self.root.pk}/{self.shoes.pk}/{self.boots.pk}/')
+        with self.assertNumQueries(1):
+            names = set(Category.objects.descendants_of(self.root.pk).values_list('name', flat=True))
+        self.assertEqual(names, {'Clothes', 'Shoes', 'Boots'})
+
+        product = Product.objects.create(code='S1', name='Ботфорты', category=self.boots)
+        Product.objects.create(code='A1', name='Ремень', category=self.other)
+        self.assertEqual(list(Product.objects.in_category_tree(self.root)), [product])
+
+    def test_reparent_moves_subtree(self):
+        self.shoes.parent = self.other
+        self.shoes.save()
+        self.boots.refresh_from_db()
+        self.assertEqual(self.boots.path, f'/{self.other.pk}/{self.shoes.pk}/{self.boots.pk}/')
+        self.assertEqual(Category.objects.descendants_of(self.root, include_self=False).count(), 0)
+
+    def test_cycle_rejected(self):
+        self.root.parent = self.boots
+        with self.assertRaises(ValidationError):
+            self.root.full_clean()
+        with self.assertRaises(ValueError):
+            self.root.save()
+
+    def test_parent_without_path_is_rejected(self):
+        Category.objects.filter(pk=self.other.pk).update(path='')
+        child = Category(name='Scarves', parent=self.other)
+        with self.assertRaises(ValidationError):
+            child.full_clean()
+        with self.assertRaises(ValueError):
+            child.save()
+
+    def test_delete_reroots_children(self):
+        self.root.delete()
+        self.boots.refresh_from_db()
+        self.assertEqual(self.boots.path, f'/{self.shoes.pk}/{self.boots.pk}/')
+
+    def test_queryset_delete_of_ancestors_reroots_grandchildren(self):
+        laces = Category.objects.create(name='Laces', parent=self.boots)
+        Category.objects.filter(pk__in=[self.root.pk, self.shoes.pk]).delete()
+        self.boots.refresh_from_db()
+        laces.refresh_from_db()
+        self.assertEqual(self.boots.path, f'/{self.boots.pk}/')
+        self.assertEqual(laces.path, f'/{self.boots.pk}/{laces.pk}/')
+
+    def test_rebuild_command(self):
+        Category.objects.update(path='')
+        call_command('rebuild_category_tree', stdout=StringIO())
+        self.boots.refresh_from_db()
+        self.assertEqual(self.boots.path, f'/{self.root.pk}/{self.shoes.pk}/{self.boots.pk}/')
+
+
+class CategoryTreeEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(name='Clothes')
+        Category.objects.create(name='Shoes', parent=self.root)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_nested_tree_and_not_modified(self):
+        # Число запросов - к данным; общий DatabaseCache добавил бы свои
+        cache.clear()
+        url = reverse('category-tree')
+        response = self.client.get(url)
+        tree = response.json()
+        self.assertEqual(tree[0]['name'], 'Clothes')
+        self.assertEqual(tree[0]['children'][0]['name'], 'Shoes')
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_save_changes_etag(self):
+        url = reverse('category-tree')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Category.objects.create(name='Hats', parent=self.root)
+            # До commit версия прежняя: параллельный читатель не закеширует
+            # старое дерево под новой версией
+            self.assertEqual(self.client.get(url)['ETag'], etag)
+        self.assertTrue(callbacks)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()[0]['children']), 2)
+
+    def test_evicted_version_does_not_match_old_etag(self):
+        url = reverse('category-tree')
+        with mock.patch.object(category_tree.time, 'time', return_value=1_000_000):
+            etag = self.client.get(url)['ETag']
+        cache.delete(category_tree.VERSION_KEY)
+        with mock.patch.object(category_tree.time, 'time', return_value=1_000_060):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_version_expires_after_bump(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Hats', parent=self.root)
+        self.assertIsNotNone(cache.get(category_tree.VERSION_KEY))
+        later = now + timedelta(seconds=category_tree.VERSION_TIMEOUT + 60)
+        with mock.patch('django.core.cache.backends.db.tz_now', return_value=later - timedelta(seconds=120)):
+            self.assertIsNotNone(cache.get(category_tree.VERSION_KEY))
+        with mock.patch('django.core.cache.backends.db.tz_now', return_value=later):
+            self.assertIsNone(cache.get(category_tree.VERSION_KEY))
+
+
+class ProductDetailConditionalTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(code='D1', name='Куртка', description='x' * 1000)
+        self.url = reverse('product-detail', args=[self.product.pk])
+
+    def test_etag_round_trip(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['code'], 'D1')
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        self.product.name = 'Пуховик'
+        self.product.save()
+        fresh = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.url)
+        cached = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_fields_projection(self):
+        response = self.client.get(self.url, {'fields': 'code,name'})
+        self.assertEqual(response.json(), {'id': self.product.pk, 'code': 'D1', 'name': 'Куртка'})
+        self.assertNotEqual(response['ETag'], self.client.get(self.url)['ETag'])
+        self.assertEqual(self.client.get(self.url, {'fields': 'price'}).status_code, 400)
+
+
+@override_settings(API_TOKENS=['till-1'])
+class ProductLookupTests(TestCase):
+    def setUp(self):
+        # Касса: без сессии и CSRF-cookie, с токеном устройства
+        self.client = Client(enforce_csrf_checks=True, headers={'Authorization': 'Token till-1'})
+
+    def test_codes_and_ids_in_one_query(self):
+        a = Product.objects.create(code='L1', name='Брюки')
+        b = Product.objects.create(code='L2', name='Юбка')
+        body = {'codes': ['L1', 'NOPE'], 'ids': [b.pk, 999999]}
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('product-lookup'), body, content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['by_code']['L1']['id'], a.pk)
+        self.assertEqual(data['by_id'][str(b.pk)]['code'], 'L2')
+        self.assertEqual(data['missing'], {'codes': ['NOPE'], 'ids': [999999]})
+
+    def test_limit(self):
+        body = {'codes': [str(i) for i in range(501)]}
+        response = self.client.post(reverse('product-lookup'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_token_required(self):
+        for headers in ({}, {'Authorization': 'Token other'}, {'Authorization': 'Bearer till-1'}):
+            client = Client(enforce_csrf_checks=True, headers=headers)
+            response = client.post(reverse('product-lookup'), {'codes': []}, content_type='application/json')
+            self.assertEqual(response.status_code, 401)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        Product.objects.create(code='ZX-1001', name='Кроссовки беговые', description='легкие')
+        Product.objects.create(code='QQ-2002', name='Сумка', description='подходит к кроссовкам')
+
+    def search(self, q):
+        return self.client.get(reverse('product-search'), {'q': q}).json()['results']
+
+    def test_code_prefix_and_ranking(self):
+        self.assertEqual([r['code'] for r in self.search('zx-10')], ['ZX-1001'])
+        # Совпадение в названии весит больше, чем в описании
+        self.assertEqual([r['code'] for r in self.search('кроссовк')], ['ZX-1001', 'QQ-2002'])
+
+    def test_index_follows_save_delete_and_import(self):
+        product = Product.objects.get(code='QQ-2002')
+        product.name = 'Рюкзак'
+        product.save()
+        self.assertEqual([r['code'] for r in self.search('рюкзак')], ['QQ-2002'])
+        product.delete()
+        self.assertEqual(self.search('рюкзак'), [])
+
+        import_products([{'code': 'IM-1', 'name': 'Панама'}])
+        self.assertEqual([r['code'] for r in self.search('панама')], ['IM-1'])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM product_search')
+        self.assertEqual(self.search('сумка'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual([r['code'] for r in self.search('сумка')], ['QQ-2002'])
+
+
+class ProductAdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'a@example.com', 'pw'))
+        self.category = Category.objects.create(name='Hats')
+
+    def add_products(self, start, count):
+        for i in range(start, start + count):
+            product = Product.objects.create(code=f'AD{i}', name=f'Товар {i}', category=self.category)
+            ProductImage.objects.create(product=product, image=f'products/AD{i}/a.jpg', is_main=True)
+            ProductImage.objects.create(product=product, image=f'products/AD{i}/b.jpg')
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:product_product_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.add_products(0, 3)
+        _, small = self.changelist_queries()
+        self.add_products(3, 40)
+        response, large = self.changelist_queries()
+        self.assertEqual(small, large)
+        self.assertContains(response, 'products/AD7/a.jpg')
+        self.assertNotContains(response, 'products/AD7/b.jpg')
+
+
+class CategoryAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'a@example.com', 'pw'))
+
+    def test_slug_allocated_with_single_query(self):
+        for _ in range(4):
+            Category.objects.create(name='Shoes')
+        self.assertEqual(
+            sorted(Category.objects.values_list('slug', flat=True)),
+            ['shoes', 'shoes-1', 'shoes-2', 'shoes-3']
+        )
+        Category.objects.filter(slug='shoes-1').delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_slug('Shoes'), 'shoes-1')
+        # Кириллица дает пустой slugify - подставляется запасной slug
+        self.assertEqual(Category.objects.create(name='Обувь').slug, 'category')
+        self.assertEqual(Category.objects.create(name='Одежда').slug, 'category-1')
+
+    def test_counts_include_descendants(self):
+        root = Category.objects.create(name='Root')
+        child = Category.objects.create(name='Child', parent=root)
+        Product.objects.create(code='CA1', name='A', category=root)
+        Product.objects.create(code='CA2', name='B', category=child)
+        Product.objects.create(code='CA3', name='C', category=child)
+
+        counts = {
+            c.name: (c.products_total, c.tree_products_total)
+            for c in Category.objects.with_product_counts(include_descendants=True)
+        }
+        self.assertEqual(counts, {'Root': (1, 3), 'Child': (2, 2)})
+
+    def test_changelist_query_count_is_constant(self):
+        def changelist_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('admin:product_category_changelist'))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        parent = Category.objects.create(name='Parent')
+        Category.objects.create(name='Kid', parent=parent)
+        small = changelist_queries()
+        for i in range(30):
+            Category.objects.create(name=f'Kid {i}', parent=parent)
+        self.assertEqual(changelist_queries(), small)
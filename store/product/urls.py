@@ -4,7 +4,11 @@ from . import views
 
 urlpatterns = [
     path('categories/', views.category_list, name='category-list'),
+    path('categories/tree/', views.category_tree_view, name='category-tree'),
     path('categories/<int:pk>/', views.category_detail, name='category-detail'),
     path('products/', views.product_list, name='product-list'),
+    path('products/bulk/', views.product_bulk_import, name='product-bulk-import'),
+    path('products/lookup/', views.product_lookup, name='product-lookup'),
+    path('products/search/', views.product_search, name='product-search'),
     path('products/<int:pk>/', views.product_detail, name='product-detail'),
 ]
\ No newline at end of file
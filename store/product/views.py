@@ -1,13 +1,77 @@
-from django.http import JsonResponse
-from .models import Category, Product
+import codecs
+import hashlib
 import json
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import category_tree, search
+from .api_auth import api_token_required
+from .importers import READERS, import_products
+from .models import Category, Product
+from .pagination import after_cursor, decode_cursor, page, parse_limit
+
+# Размер чанка потоковой выдачи списков
+STREAM_CHUNK_SIZE = 2000
+
+# Поля карточки товара, доступные для ?fields=
+PRODUCT_DETAIL_FIELDS = (
+    'id', 'code', 'name', 'description', 'category_id', 'created_at', 'updated_at'
+)
+
+# Пакетный поиск товаров для сканеров и касс
+MAX_LOOKUP_ITEMS = 500
+LOOKUP_FIELDS = ('id', 'code', 'name', 'category_id', 'updated_at')
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+def _stream_json_array(rows):
+    """Построчная сериализация JSON-массива без накопления в памяти"""
+    yield '['
+    first = True
+    for row in rows:
+        if not first:
+            yield ','
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False)
+        first = False
+    yield ']'
+
+
+def _list_response(request, queryset):
+    """
+    Выдача списка с keyset-пагинацией по (name, id).
+
+    ?limit=N&cursor=... - страница из N строк и курсор следующей страницы;
+    ?stream=1 - весь список (начиная с cursor) потоком через .iterator().
+    """
+    queryset = queryset.order_by('name', 'pk')
+    try:
+        cursor = request.GET.get('cursor')
+        if cursor:
+            queryset = after_cursor(queryset, ('name', 'pk'), decode_cursor(cursor, (str, int)))
+        limit = parse_limit(request.GET.get('limit'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if request.GET.get('stream') in ('1', 'true'):
+        rows = queryset.values().iterator(chunk_size=STREAM_CHUNK_SIZE)
+        return StreamingHttpResponse(
+            _stream_json_array(rows),
+            content_type='application/json'
+        )
+
+    rows, next_cursor = page(queryset.values(), limit, ('name', 'id'))
+    return JsonResponse({'results': rows, 'next_cursor': next_cursor})
+
 
 def category_list(request):
     if request.method == 'GET':
-        categories = Category.objects.all()
-        data = list(categories.values())
-        return JsonResponse(data, safe=False)
+        return _list_response(request, Category.objects.all())
 
     elif request.method == 'POST':
         data = json.loads(request.body)
@@ -19,6 +83,23 @@ def category_list(request):
         return JsonResponse({'id': category.id}, status=201)
 
 
+def category_tree_view(request):
+    """
+    Вложенное дерево категорий для меню витрины.
+    Совпавший If-None-Match отвечает 304 без обращения к БД.
+    """
+    version = category_tree.get_version()
+    etag = category_tree.etag_for(version)
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(category_tree.get_tree(version), safe=False)
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
 def category_detail(request, pk):
     try:
         category = Category.objects.get(pk=pk)
@@ -37,9 +118,7 @@ def category_detail(request, pk):
 
 def product_list(request):
     if request.method == 'GET':
-        products = Product.objects.all()
-        data = list(products.values())
-        return JsonResponse(data, safe=False)
+        return _list_response(request, Product.objects.all())
 
     elif request.method == 'POST':
         data = json.loads(request.body)
@@ -52,20 +131,106 @@ def product_list(request):
         return JsonResponse({'id': product.id}, status=201)
 
 
-def product_detail(request, pk):
+def product_bulk_import(request):
+    """
+    Массовый upsert товаров по code.
+    Тело запроса - CSV (Content-Type: text/csv) или JSON Lines, читается потоком.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    fmt = 'csv' if request.content_type == 'text/csv' else 'jsonl'
+    stream = codecs.getreader('utf-8')(request)
+    try:
+        result = import_products(READERS[fmt](stream))
+    except UnicodeDecodeError:
+        return JsonResponse({'error': 'Ожидается текст в UTF-8'}, status=400)
+    return JsonResponse(result.as_dict())
+
+
+@api_token_required
+def product_lookup(request):
+    """
+    Пакетный поиск товаров: {"codes": [...], "ids": [...]} -> найденные
+    товары по коду и по id плюс явные списки промахов. Один запрос к БД.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        codes = list(dict.fromkeys(str(code) for code in data.get('codes', [])))
+        ids = list(dict.fromkeys(int(pk) for pk in data.get('ids', [])))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Ожидается {"codes": [...], "ids": [...]}'}, status=400)
+    if len(codes) + len(ids) > MAX_LOOKUP_ITEMS:
+        return JsonResponse({'error': f'Не более {MAX_LOOKUP_ITEMS} позиций за запрос'}, status=400)
+
+    by_code, by_id = {}, {}
+    if codes or ids:
+        rows = Product.objects.filter(Q(code__in=codes) | Q(pk__in=ids)).values(*LOOKUP_FIELDS)
+        for row in rows:
+            by_code[row['code']] = row
+            by_id[row['id']] = row
+
+    return JsonResponse({
+        'by_code': {code: by_code[code] for code in codes if code in by_code},
+        'by_id': {pk: by_id[pk] for pk in ids if pk in by_id},
+        'missing': {
+            'codes': [code for code in codes if code not in by_code],
+            'ids': [pk for pk in ids if pk not in by_id],
+        },
+    })
+
+
+def product_search(request):
+    """Полнотекстовый поиск: ?q=строка&limit=N, результаты по релевантности"""
+    query = request.GET.get('q', '').strip()
     try:
-        product = Product.objects.get(pk=pk)
-    except Product.DoesNotExist:
+        limit = min(int(request.GET.get('limit', DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit должен быть числом'}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'limit должен быть положительным'}, status=400)
+    return JsonResponse({'query': query, 'results': search.search(query, limit=limit)})
+
+
+def _parse_fields(value):
+    """?fields=a,b,c -> кортеж полей выдачи; id отдается всегда"""
+    if not value:
+        return PRODUCT_DETAIL_FIELDS
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = set(fields) - set(PRODUCT_DETAIL_FIELDS)
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    return tuple(f for f in PRODUCT_DETAIL_FIELDS if f == 'id' or f in fields)
+
+
+def product_detail(request, pk):
+    # Дешевая проба: только updated_at, без чтения description
+    updated_at = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
         return JsonResponse({'error': 'Not found'}, status=404)
 
     if request.method == 'GET':
-        data = {
-            'id': product.id,
-            'code': product.code,
-            'name': product.name,
-            'description': product.description,
-            'category_id': product.category_id,
-            'created_at': product.created_at,
-            'updated_at': product.updated_at
-        }
-        return JsonResponse(data)
\ No newline at end of file
+        try:
+            fields = _parse_fields(request.GET.get('fields'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # Разные проекции - разные представления, поэтому поля входят в ETag
+        version = f'{pk}-{int(updated_at.timestamp() * 1_000_000)}-{",".join(fields)}'
+        etag = f'"{hashlib.md5(version.encode()).hexdigest()}"'
+        last_modified = int(updated_at.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            model_fields = ['category' if f == 'category_id' else f for f in fields]
+            try:
+                product = Product.objects.only(*model_fields).get(pk=pk)
+            except Product.DoesNotExist:
+                return JsonResponse({'error': 'Not found'}, status=404)
+            response = JsonResponse({f: getattr(product, f) for f in fields})
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -1,30 +1,44 @@
 # requests/signals.py
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.apps import apps
-from django.utils import timezone
 from django.core.exceptions import ValidationError
 
+from unit.serials import allocate_serials
+
 # Получаем модели из правильных приложений
 ProductUnit = apps.get_model('unit', 'ProductUnit')  # ← Из приложения unit
 RequestItem = apps.get_model('request_units', 'RequestItem')  # ← Из request_units
 
 
+# Размер пачки INSERT при создании единиц товара
+UNIT_BATCH_SIZE = 500
+
+
+def build_product_units(request_item):
+    """Несохраненные ProductUnit для позиции заявки; серийники резервируются блоком"""
+    serials = allocate_serials(request_item.product, request_item.quantity_ordered)
+    return [
+        ProductUnit(
+            product=request_item.product,
+            request_item=request_item,
+            serial_number=serial_number,
+            status='in_request'
+        )
+        for serial_number in serials
+    ]
+
+
 @receiver(post_save, sender=RequestItem)
 def create_product_units(sender, instance, created, **kwargs):
     if created and instance.is_customer_order:
         try:
-            base_date = timezone.now().strftime("%Y%m%d%H%M")
-            product_code = instance.product.code or 'SN'
-
-            # Создаем ProductUnit для каждого заказанного товара
-            for i in range(1, instance.quantity_ordered + 1):
-                serial_number = f"{product_code}-{base_date}-{i:03d}"
-                ProductUnit.objects.create(
-                    product=instance.product,
-                    request_item=instance,
-                    serial_number=serial_number,
-                    status='in_request'
+            # Все единицы позиции - одним bulk_create (ProductUnit.save не вызывается)
+            with transaction.atomic():
+                ProductUnit.objects.bulk_create(
+                    build_product_units(instance),
+                    batch_size=UNIT_BATCH_SIZE
                 )
         except Exception as e:
-            raise ValidationError(f"Ошибка создания ProductUnit: {str(e)}")
\ No newline at end of file
+            raise ValidationError(f"Ошибка создания ProductUnit: {str(e)}")
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'files.apps.FilesConfig',
     'request_units.apps.RequestUnitsConfig',
     'suppliers.apps.SuppliersConfig',
+    'deliveries.apps.DeliveriesConfig',
 
 ]
 
@@ -91,6 +92,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Кеш общий для всех рабочих процессов: версии дерева категорий и отчетов
+# закупок, увеличенные в одном процессе, должны видеть остальные.
+# Таблица создается командой: python manage.py createcachetable
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'store_cache',
+    }
+}
+
+
+# Токены устройств (кассы, сканеры) для POST-эндпоинтов API без CSRF,
+# см. product.api_auth. Задаются через запятую: STORE_API_TOKENS=token1,token2
+
+API_TOKENS = [token for token in os.environ.get('STORE_API_TOKENS', '').split(',') if token]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -23,4 +23,7 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('product.urls')),
+    path('api/cashday/', include('cashday.urls')),
+    path('api/units/', include('unit.urls')),
+    path('api/deliveries/', include('deliveries.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -22,7 +22,7 @@ class ProductUnitAdmin(admin.ModelAdmin):
     search_fields = (
         'serial_number',
         'product__name',
-        'product__sku',
+        'product__code',
         'request_item__id',
         'supply_item__id',
     )
@@ -83,7 +83,7 @@ class ProductUnitAdmin(admin.ModelAdmin):
 
     def supply_item_link(self, obj):
         if obj.supply_item:
-            url = f"/admin/deliveries/supplyitem/{obj.supply_item.id}/change/"
+            url = f"/admin/deliveries/deliveryitem/{obj.supply_item.id}/change/"
             return format_html('<a href="{}">Поставка #{}</a>', url, obj.supply_item.id)
         return "-"
     supply_item_link.short_description = 'Позиция поставки'
@@ -0,0 +1,95 @@
+# unit  lifecycle.py
+"""
+Жизненный цикл единицы товара.
+
+TRANSITIONS - таблица допустимых переходов статусов ProductUnit.
+transition() переводит множество единиц одним UPDATE ... WHERE status IN (...),
+пишет историю статусов одним bulk_create и сдвигает счетчики остатков.
+"""
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+# Из какого статуса -> в какие можно перейти
+TRANSITIONS = {
+    'created': {'in_request', 'in_supply'},
+    'in_request': {'in_supply', 'in_store'},
+    'in_supply': {'in_store', 'lost'},
+    'in_store': {'sold', 'lost', 'transfer'},
+    'sold': {'returned'},
+    'returned': {'in_store', 'lost'},
+    'transfer': {'in_store', 'lost'},
+    'lost': {'in_store'},
+}
+
+HISTORY_BATCH_SIZE = 1000
+
+
+def allowed_sources(to_state):
+    """Статусы, из которых допустим переход в to_state"""
+    return {source for source, targets in TRANSITIONS.items() if to_state in targets}
+
+
+def can_transition(from_state, to_state):
+    return to_state in TRANSITIONS.get(from_state, ())
+
+
+@dataclass
+class TransitionResult:
+    moved: int = 0
+    rejected: int = 0
+
+
+def transition(units, to_state, note=''):
+    """
+    Переводит единицы из queryset units в статус to_state.
+
+    Единицы в статусах, из которых переход не разрешен, не меняются и
+    считаются отклоненными. Возвращает TransitionResult(moved, rejected).
+    """
+    from .models import ProductUnit, ProductUnitStatusHistory
+    from .stock import apply_stock_deltas, count_units
+
+    if to_state not in TRANSITIONS:
+        raise ValidationError({'status': f'Неизвестный статус: {to_state}'})
+    sources = allowed_sources(to_state)
+
+    with transaction.atomic():
+        total = units.count()
+        # Блокируем переводимые строки и запоминаем исходные статусы для истории
+        moving = list(
+            ProductUnit.objects.select_for_update()
+            .filter(pk__in=Subquery(units.values('pk')), status__in=sources)
+            .values_list('pk', 'product_id', 'status')
+        )
+        if not moving:
+            return TransitionResult(moved=0, rejected=total)
+
+        now = timezone.now()
+        moved = ProductUnit.objects.filter(
+            pk__in=Subquery(units.values('pk')), status__in=sources
+        ).update(status=to_state, updated_at=now)
+
+        ProductUnitStatusHistory.objects.bulk_create(
+            [
+                ProductUnitStatusHistory(
+                    unit_id=pk,
+                    product_id=product_id,
+                    from_status=status,
+                    to_status=to_state,
+                    changed_at=now,
+                    note=note,
+                )
+                for pk, product_id, status in moving
+            ],
+            batch_size=HISTORY_BATCH_SIZE,
+        )
+
+        deltas = count_units((product_id, to_state) for _, product_id, _ in moving)
+        deltas.subtract((product_id, status) for _, product_id, status in moving)
+        apply_stock_deltas(deltas)
+
+    return TransitionResult(moved=moved, rejected=total - moved)
@@ -0,0 +1,109 @@
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from product.models import Product
+from unit.inventory import build_snapshots, day_end, stock_on
+from unit.lifecycle import transition
+from unit.models import ProductUnit, ProductUnitStatusHistory
+from unit.stock import availability
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark inventory snapshots and point-in-time stock on synthetic data (rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--units', type=int, default=1_000_000, help='Synthetic units (default: 1000000)')
+        parser.add_argument('--products', type=int, default=1000, help='Synthetic products (default: 1000)')
+        parser.add_argument('--days', type=int, default=90, help='History length in days (default: 90)')
+        parser.add_argument('--batch-size', type=int, default=10000, help='INSERT batch size (default: 10000)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Synthetic data rolled back')
+
+    def timed(self, label, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(f'{label:<45} {time.perf_counter() - started:8.3f}s')
+        return result
+
+    def run(self, options):
+        days = options['days']
+        today = timezone.localdate()
+        first_day = today - timedelta(days=days)
+        batch_size = options['batch_size']
+
+        prefix = f'BENCH-{int(time.time())}'
+        products = self.timed('create products', lambda: Product.objects.bulk_create([
+            Product(code=f'{prefix}-{i}', name=f'Benchmark {i}') for i in range(options['products'])
+        ]))
+
+        def create_units():
+            for offset in range(0, options['units'], batch_size):
+                size = min(batch_size, options['units'] - offset)
+                ProductUnit.objects.bulk_create([
+                    ProductUnit(
+                        product=random.choice(products),
+                        serial_number=f'{prefix}-{offset + i}',
+                        status='in_store',
+                    )
+                    for i in range(size)
+                ], batch_size=batch_size)
+
+        self.timed(f'create {options["units"]} units (+history, counters)', create_units)
+
+        # Единицы "пришли" до начала истории
+        ProductUnitStatusHistory.objects.filter(
+            unit__serial_number__startswith=prefix, from_status=''
+        ).update(changed_at=day_end(first_day - timedelta(days=1)) - timedelta(hours=1))
+
+        # Продажи ~30% единиц, разбросанные по дням истории: статус, счетчики
+        # и история меняются через transition(), затем история датируется днем продажи
+        def create_sales():
+            units = ProductUnit.objects.filter(serial_number__startswith=prefix).values_list('pk', flat=True)
+            by_day = defaultdict(list)
+            for pk in units.iterator(chunk_size=batch_size):
+                if random.random() < 0.3:
+                    by_day[random.randrange(days)].append(pk)
+            for offset, pks in by_day.items():
+                moment = day_end(first_day + timedelta(days=offset)) - timedelta(hours=1)
+                for i in range(0, len(pks), batch_size):
+                    chunk = pks[i:i + batch_size]
+                    transition(ProductUnit.objects.filter(pk__in=chunk), 'sold')
+                    ProductUnitStatusHistory.objects.filter(unit_id__in=chunk, to_status='sold').update(
+                        changed_at=moment
+                    )
+
+        self.timed('sell ~30% of units over the history', create_sales)
+
+        # Снимки только за завершенные дни
+        last_day = today - timedelta(days=1)
+        rows = self.timed(f'build snapshots for {days} days', lambda: build_snapshots(first_day, last_day))
+        self.stdout.write(f'{"snapshot rows":<45} {rows:8d}')
+        # Нет движений сегодня - остаток на вчера совпадает со счетчиками
+        current = availability([product.pk for product in products])
+        consistent = stock_on(last_day, list(current)) == current
+        self.stdout.write(f'{"snapshots match ProductStock counters":<45} {"yes" if consistent else "NO":>8}')
+
+        middle = first_day + timedelta(days=days // 2)
+        sample = [product.pk for product in products[:50]]
+        self.timed('stock_on(mid-range day, 50 products)', lambda: stock_on(middle, sample))
+        self.timed('stock_on(mid-range day, all products)', lambda: stock_on(middle))
+        self.timed('full COUNT over units (current state)', lambda: list(
+            ProductUnit.objects.order_by().values('product_id', 'status').annotate(n=Count('pk'))
+        ))
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from product.models import Product
+from request_units.signals import RequestItem, build_product_units
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Time ProductUnit creation through the request_units post_save signal '
+        'against per-row create of the same units (changes are rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000],
+            help='Units per order line to benchmark (default: 10 100 1000)'
+        )
+        parser.add_argument(
+            '--product-code',
+            help='Product to attach units to (default: first product)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs per size, the best one is reported (default: 3)'
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_code']:
+            products = products.filter(code=options['product_code'])
+        product = products.first()
+        if product is None:
+            raise CommandError('No product found to attach benchmark units to')
+
+        self.stdout.write(f'{"units":>6} {"per-row, s":>11} {"signal, s":>10} {"speedup":>8}')
+        for size in options['sizes']:
+            per_row = self.measure(lambda: self.create_per_row(product, size), options['repeat'])
+            signal = self.measure(lambda: self.create_request_item(product, size), options['repeat'])
+            speedup = per_row / signal if signal else float('inf')
+            self.stdout.write(f'{size:>6} {per_row:>11.4f} {signal:>10.4f} {speedup:>7.1f}x')
+
+    def measure(self, create, repeat):
+        """Лучшее время из repeat прогонов; каждый прогон откатывается"""
+        best = None
+        for _ in range(max(repeat, 1)):
+            try:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    create()
+                    elapsed = time.perf_counter() - started
+                    raise Rollback
+            except Rollback:
+                pass
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def create_request_item(self, product, size):
+        # Рабочий путь: post_save RequestItem -> create_product_units
+        RequestItem.objects.create(product=product, quantity_ordered=size, is_customer_order=True)
+
+    def create_per_row(self, product, size):
+        # Прежний путь сигнала: те же единицы, по INSERT и ProductUnit.save на каждую
+        request_item = RequestItem.objects.create(
+            product=product, quantity_ordered=size, is_customer_order=False
+        )
+        for unit in build_product_units(request_item):
+            unit.save()
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from unit.inventory import build_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Build daily per-product, per-status inventory snapshots for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help='First day, YYYY-MM-DD (default: yesterday)'
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last day, YYYY-MM-DD (default: same as --start)'
+        )
+
+    def handle(self, *args, **options):
+        start = options['start'] or timezone.localdate() - timedelta(days=1)
+        end = options['end'] or start
+        if start > end:
+            raise CommandError('--start must not be after --end')
+        if end >= timezone.localdate():
+            raise CommandError('--end must be before today: only finished days can be snapshotted')
+        rows = build_snapshots(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Saved {rows} snapshot rows for {start}..{end}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from unit.stock import rebuild_stock
+
+
+class Command(BaseCommand):
+    help = 'Reconcile per-product stock counters with ProductUnit rows'
+
+    def handle(self, *args, **options):
+        drift = rebuild_stock()
+        for (product_id, status), (stored, actual) in sorted(drift.items()):
+            self.stderr.write(f'Product {product_id} / {status}: {stored} -> {actual}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Stock counters rebuilt, {len(drift)} counters corrected'
+        ))
@@ -1,7 +1,107 @@
 # unit  models.py
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.utils.crypto import get_random_string
+from django.db import models, transaction
+from django.utils import timezone
+
+from .lifecycle import can_transition
+from .serials import allocate_serials
+from .stock import apply_stock_deltas, count_units
+
+
+def unit_changes(previous, current):
+    """
+    Записи истории [(from_status, to_status, product_id)] и приращения остатков
+    при переходе единицы из previous в current. Состояния - (статус, product_id);
+    previous=None - создание единицы.
+    """
+    status, product_id = current
+    deltas = count_units([(product_id, status)])
+    if previous is None:
+        return [('', status, product_id)], deltas
+    previous_status, previous_product_id = previous
+    deltas.subtract([(previous_product_id, previous_status)])
+    if previous_product_id != product_id:
+        # Перенос на другой товар: уход с прежнего и приход на новый
+        return [(previous_status, '', previous_product_id), ('', status, product_id)], deltas
+    if previous_status != status:
+        return [(previous_status, status, product_id)], deltas
+    return [], deltas
+
+
+class ProductUnitQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        bulk_create не вызывает save - историю и счетчики остатков ведем здесь.
+        При update_conflicts=True строки, уже бывшие в БД, обновляются, а не
+        вставляются: для них учитывается только смена статуса и товара.
+        ignore_conflicts не поддерживается: без первичных ключей неизвестно,
+        какие строки вставлены, и счетчики разошлись бы с БД.
+        """
+        if kwargs.get('ignore_conflicts'):
+            raise ValueError(
+                'ProductUnit.bulk_create не поддерживает ignore_conflicts, '
+                'используйте update_conflicts'
+            )
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            stored = [None] * len(objs)
+            if kwargs.get('update_conflicts'):
+                stored = self._stored_states(objs, kwargs.get('unique_fields'))
+            created = super().bulk_create(objs, *args, **kwargs)
+            update_fields = set(kwargs.get('update_fields') or ())
+            history = []
+            deltas = count_units([])
+            for unit, old in zip(objs, stored):
+                if old is None:
+                    unit_id, previous = unit.pk, None
+                    current = (unit.status, unit.product_id)
+                else:
+                    # Поля вне update_fields сохраняют значения из БД
+                    unit_id, previous = old[0], old[1:]
+                    current = (
+                        unit.status if 'status' in update_fields else previous[0],
+                        unit.product_id if 'product' in update_fields else previous[1],
+                    )
+                unit_history, unit_deltas = unit_changes(previous, current)
+                history.extend((unit_id, *entry) for entry in unit_history)
+                deltas.update(unit_deltas)
+
+            now = timezone.now()
+            ProductUnitStatusHistory.objects.bulk_create(
+                [
+                    ProductUnitStatusHistory(
+                        unit_id=unit_id, product_id=product_id,
+                        from_status=from_status, to_status=to_status, changed_at=now
+                    )
+                    for unit_id, from_status, to_status, product_id in history
+                ],
+                batch_size=kwargs.get('batch_size'),
+            )
+            apply_stock_deltas(deltas)
+        return created
+
+    def _stored_states(self, objs, unique_fields):
+        """
+        (pk, статус, product_id) строк БД, совпадающих с objs по unique_fields,
+        по одной на объект; None - такой строки нет и объект будет вставлен.
+        """
+        opts = self.model._meta
+        names = [
+            opts.pk.attname if name == 'pk' else opts.get_field(name).attname
+            for name in unique_fields or ['pk']
+        ]
+        keys = [tuple(getattr(unit, name) for name in names) for unit in objs]
+        if len(names) == 1:
+            lookup = models.Q(**{f'{names[0]}__in': [key[0] for key in keys]})
+        else:
+            lookup = models.Q(pk__in=[])
+            for key in set(keys):
+                lookup |= models.Q(**dict(zip(names, key)))
+        rows = self.model._base_manager.using(self.db).filter(lookup).values_list(
+            *names, 'pk', 'status', 'product_id'
+        )
+        stored = {row[:len(names)]: row[len(names):] for row in rows}
+        return [stored.get(key) for key in keys]
 
 
 class ProductUnit(models.Model):
@@ -40,7 +140,7 @@ class ProductUnit(models.Model):
     )
 
     supply_item = models.ForeignKey(
-        'deliveries.SupplyItem',
+        'deliveries.DeliveryItem',
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
@@ -64,34 +164,76 @@ class ProductUnit(models.Model):
         auto_now=True
     )
 
+    objects = ProductUnitQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Единица товара'
         verbose_name_plural = 'Единицы товаров'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['serial_number']),
+            models.Index(fields=['status']),
+            models.Index(fields=['product', 'status']),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.serial_number} ({self.get_status_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance._saved_status = instance.status
+        if 'product_id' in field_names:
+            instance._saved_product_id = instance.product_id
+        return instance
+
+    def _previous_state(self):
+        """
+        (статус, product_id) сохраненной версии единицы; None - новая единица.
+        Если статус не загружен (ручной pk, .only() без status) - читается из БД.
+        """
+        saved = (getattr(self, '_saved_status', None), getattr(self, '_saved_product_id', None))
+        if not self._state.adding and None not in saved:
+            return saved
+        if self.pk is None:
+            return None
+        return ProductUnit._base_manager.filter(pk=self.pk).values_list('status', 'product_id').first()
+
     def save(self, *args, **kwargs):
-        """Генерация серийного номера при создании"""
+        """
+        Генерация серийного номера при создании; создание и смена статуса
+        пишутся в историю, счетчики остатков меняются на разницу.
+        """
         if not self.serial_number:
             self.serial_number = self.generate_serial_number()
-        super().save(*args, **kwargs)
-
-    def generate_serial_number(self):
-        """Улучшенная генерация серийного номера"""
-        prefix = (self.product.sku[:3] if self.product and self.product.sku else 'SN').upper()
-        max_attempts = 10
-        attempt = 0
+        with transaction.atomic():
+            previous = self._previous_state()
+            super().save(*args, **kwargs)
+            history, deltas = unit_changes(previous, (self.status, self.product_id))
+            ProductUnitStatusHistory.objects.bulk_create([
+                ProductUnitStatusHistory(
+                    unit=self, product_id=product_id, from_status=from_status, to_status=to_status
+                )
+                for from_status, to_status, product_id in history
+            ])
+            apply_stock_deltas(deltas)
+        self._saved_status = self.status
+        self._saved_product_id = self.product_id
 
-        while attempt < max_attempts:
-            random_part = get_random_string(8, allowed_chars='0123456789ABCDEF')
-            new_serial = f"{prefix}-{random_part}"
-            if not ProductUnit.objects.filter(serial_number=new_serial).exists():
-                return new_serial
-            attempt += 1
+    def transition_to(self, to_state, note=''):
+        """Перевод одной единицы по таблице переходов (см. unit.lifecycle)"""
+        from .lifecycle import transition
+        result = transition(ProductUnit.objects.filter(pk=self.pk), to_state, note=note)
+        if not result.moved:
+            raise ValidationError({'status': f'Переход {self.status} -> {to_state} запрещен'})
+        self.status = to_state
+        self._saved_status = to_state
+        self._saved_product_id = self.product_id
 
-        raise ValueError('Не удалось сгенерировать уникальный серийный номер')
+    def generate_serial_number(self):
+        """Серийный номер из аллокатора (см. unit.serials), без проверочных запросов"""
+        return allocate_serials(self.product, 1)[0]
 
     def clean(self):
         """Валидация перед сохранением"""
@@ -99,10 +241,145 @@ class ProductUnit(models.Model):
             raise ValidationError({'serial_number': 'Серийный номер обязателен'})
         if len(self.serial_number) > 100:
             raise ValidationError({'serial_number': 'Максимальная длина 100 символов'})
+        previous = getattr(self, '_saved_status', None)
+        if previous and previous != self.status and not can_transition(previous, self.status):
+            raise ValidationError({'status': f'Переход {previous} -> {self.status} запрещен'})
+
+
+class ProductUnitStatusHistory(models.Model):
+    """История смены статусов единиц товара"""
+
+    # При удалении единицы история сохраняется - она нужна для остатков на дату
+    unit = models.ForeignKey(
+        ProductUnit,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='status_history',
+        verbose_name='Единица товара'
+    )
+    # Денормализовано для отчетов по товару без JOIN с ProductUnit
+    product = models.ForeignKey(
+        'product.Product',
+        on_delete=models.CASCADE,
+        related_name='unit_status_history',
+        verbose_name='Товар'
+    )
+    # Пустой from_status - создание единицы, пустой to_status - удаление
+    from_status = models.CharField(
+        'Прежний статус',
+        max_length=20,
+        choices=ProductUnit.STATUS_CHOICES,
+        blank=True
+    )
+    to_status = models.CharField(
+        'Новый статус',
+        max_length=20,
+        choices=ProductUnit.STATUS_CHOICES,
+        blank=True
+    )
+    changed_at = models.DateTimeField(
+        'Дата изменения',
+        default=timezone.now
+    )
+    note = models.CharField(
+        'Комментарий',
+        max_length=255,
+        blank=True
+    )
 
     class Meta:
+        verbose_name = 'Смена статуса единицы'
+        verbose_name_plural = 'История статусов единиц'
+        ordering = ['-changed_at']
         indexes = [
-            models.Index(fields=['serial_number']),
-            models.Index(fields=['status']),
-            models.Index(fields=['product', 'status']),
-        ]
\ No newline at end of file
+            models.Index(fields=['unit', 'changed_at']),
+            models.Index(fields=['product', 'changed_at']),
+            models.Index(fields=['changed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.unit_id}: {self.from_status} -> {self.to_status}"
+
+
+class ProductStock(models.Model):
+    """Количество единиц товара в статусе (поддерживается приращениями)"""
+
+    product = models.ForeignKey(
+        'product.Product',
+        on_delete=models.CASCADE,
+        related_name='stock_counters',
+        verbose_name='Товар'
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=20,
+        choices=ProductUnit.STATUS_CHOICES
+    )
+    count = models.IntegerField(
+        'Количество',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Остаток товара'
+        verbose_name_plural = 'Остатки товаров'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'status'], name='unique_product_stock_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} / {self.status}: {self.count}"
+
+
+class InventorySnapshot(models.Model):
+    """Количество единиц товара в статусе на конец дня"""
+
+    date = models.DateField('Дата')
+    product = models.ForeignKey(
+        'product.Product',
+        on_delete=models.CASCADE,
+        related_name='inventory_snapshots',
+        verbose_name='Товар'
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=20,
+        choices=ProductUnit.STATUS_CHOICES
+    )
+    count = models.IntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Снимок остатков'
+        verbose_name_plural = 'Снимки остатков'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'product', 'status'], name='unique_inventory_snapshot'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product_id} / {self.status}: {self.count}"
+
+
+class SerialCounter(models.Model):
+    """Счетчик последовательных серийных номеров товара"""
+
+    product = models.OneToOneField(
+        'product.Product',
+        on_delete=models.CASCADE,
+        related_name='serial_counter',
+        verbose_name='Товар'
+    )
+    last_value = models.PositiveBigIntegerField(
+        'Последний выданный номер',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Счетчик серийных номеров'
+        verbose_name_plural = 'Счетчики серийных номеров'
+
+    def __str__(self):
+        return f"{self.product_id}: {self.last_value}"
@@ -0,0 +1,130 @@
+# unit  serials.py
+"""
+Выдача серийных номеров ProductUnit.
+
+Аллокатор выбирается настройкой UNIT_SERIAL_ALLOCATOR (путь к классу).
+Оба аллокатора выдают уникальные номера без проверочных запросов exists()
+и умеют резервировать сразу блок из N номеров для bulk_create.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+DEFAULT_ALLOCATOR = 'unit.serials.SequenceSerialAllocator'
+SERIAL_MAX_LENGTH = 100
+
+
+# Признак префикса по id товара. Коды с этим символом тоже уходят в запасной
+# префикс, поэтому он не совпадет ни с одним кодом
+FALLBACK_MARK = '#'
+
+
+def serial_prefix(product, reserve):
+    """
+    Префикс - код товара как есть (коды уникальны с учетом регистра).
+    Пустой, слишком длинный или содержащий FALLBACK_MARK код заменяется на #<id товара>.
+    """
+    code = product.code or ''
+    if not code or FALLBACK_MARK in code or len(code) + reserve > SERIAL_MAX_LENGTH:
+        return f'{FALLBACK_MARK}{product.pk}'
+    return code
+
+
+class SequenceSerialAllocator:
+    """
+    Последовательные номера по товару: КОД-00000001, КОД-00000002, ...
+
+    Блок номеров резервируется одним атомарным UPDATE счетчика товара
+    (SerialCounter), поэтому параллельные заявки получают непересекающиеся блоки.
+    """
+    width = 8
+
+    def allocate(self, product, count=1):
+        from .models import SerialCounter
+
+        if count < 1:
+            return []
+        with transaction.atomic():
+            updated = SerialCounter.objects.filter(product_id=product.pk).update(
+                last_value=F('last_value') + count
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        SerialCounter.objects.create(product_id=product.pk, last_value=count)
+                except IntegrityError:
+                    # Счетчик создан параллельной транзакцией
+                    SerialCounter.objects.filter(product_id=product.pk).update(
+                        last_value=F('last_value') + count
+                    )
+            last = SerialCounter.objects.filter(product_id=product.pk).values_list(
+                'last_value', flat=True
+            ).get()
+
+        prefix = serial_prefix(product, reserve=self.width + 1)
+        return [f'{prefix}-{value:0{self.width}d}' for value in range(last - count + 1, last + 1)]
+
+
+class UlidSerialAllocator:
+    """
+    Номера вида КОД-<ULID>: 48 бит времени в мс + 80 бит случайности
+    (Crockford base32, 26 символов). Не обращается к БД; номера внутри
+    блока монотонны - случайная часть увеличивается на 1.
+    """
+    alphabet = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+    length = 26
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def _encode(self, value):
+        chars = []
+        for _ in range(self.length):
+            value, index = divmod(value, 32)
+            chars.append(self.alphabet[index])
+        return ''.join(reversed(chars))
+
+    def _next_values(self, count):
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                # Старший бит обнулен - запас на инкременты внутри одной мс
+                self._last_random = int.from_bytes(os.urandom(10), 'big') >> 1
+            values = []
+            for _ in range(count):
+                self._last_random += 1
+                if self._last_random >= 1 << 80:
+                    raise OverflowError('Исчерпан диапазон ULID в текущей миллисекунде')
+                values.append((self._last_ms << 80) | self._last_random)
+            return values
+
+    def allocate(self, product, count=1):
+        prefix = serial_prefix(product, reserve=self.length + 1)
+        return [f'{prefix}-{self._encode(value)}' for value in self._next_values(count)]
+
+
+_allocator = None
+_allocator_path = None
+
+
+def get_allocator():
+    """Экземпляр аллокатора из настройки UNIT_SERIAL_ALLOCATOR"""
+    global _allocator, _allocator_path
+    path = getattr(settings, 'UNIT_SERIAL_ALLOCATOR', DEFAULT_ALLOCATOR)
+    if _allocator is None or path != _allocator_path:
+        _allocator = import_string(path)()
+        _allocator_path = path
+    return _allocator
+
+
+def allocate_serials(product, count=1):
+    """Резервирует count уникальных серийных номеров для товара"""
+    return get_allocator().allocate(product, count)
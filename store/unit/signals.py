@@ -0,0 +1,15 @@
+# unit  signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ProductUnit, ProductUnitStatusHistory
+from .stock import apply_stock_deltas, count_units
+
+
+@receiver(post_delete, sender=ProductUnit)
+def release_stock(sender, instance, **kwargs):
+    ProductUnitStatusHistory.objects.create(
+        product_id=instance.product_id, from_status=instance.status, to_status=''
+    )
+    deltas = count_units([(instance.product_id, instance.status)])
+    apply_stock_deltas({key: -value for key, value in deltas.items()})
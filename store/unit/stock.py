@@ -0,0 +1,91 @@
+# unit  stock.py
+"""
+Остатки по товарам: денормализованные счетчики единиц в каждом статусе.
+
+Счетчики (ProductStock) меняются приращениями при создании, смене статуса и
+удалении ProductUnit, поэтому наличие товара читается одной строкой без
+COUNT по единицам. Для сверки - команда rebuild_stock.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+
+def apply_stock_deltas(deltas):
+    """
+    Применяет приращения {(product_id, status): n} атомарными UPDATE;
+    отсутствующие счетчики создаются.
+    """
+    from .models import ProductStock
+
+    for (product_id, status), delta in deltas.items():
+        if not delta:
+            continue
+        updated = ProductStock.objects.filter(product_id=product_id, status=status).update(
+            count=F('count') + delta
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                ProductStock.objects.create(product_id=product_id, status=status, count=delta)
+        except IntegrityError:
+            # Счетчик создан параллельной транзакцией
+            ProductStock.objects.filter(product_id=product_id, status=status).update(
+                count=F('count') + delta
+            )
+
+
+def count_units(units):
+    """Приращения для набора (product_id, status)"""
+    return Counter(units)
+
+
+def availability(product_ids):
+    """
+    Остатки по статусам для набора товаров одним запросом:
+    {product_id: {status: count}}; товары без единиц - пустой словарь.
+    """
+    from .models import ProductStock
+
+    result = {product_id: {} for product_id in product_ids}
+    rows = ProductStock.objects.filter(product_id__in=list(result), count__gt=0).values_list(
+        'product_id', 'status', 'count'
+    )
+    for product_id, status, count in rows:
+        result[product_id][status] = count
+    return result
+
+
+def rebuild_stock():
+    """
+    Пересчитывает счетчики по ProductUnit (GROUP BY product, status - по индексу)
+    и возвращает расхождения {(product_id, status): (было, стало)}.
+    """
+    from .models import ProductStock, ProductUnit
+
+    with transaction.atomic():
+        actual = {
+            (row['product_id'], row['status']): row['count']
+            for row in ProductUnit.objects.order_by()
+            .values('product_id', 'status')
+            .annotate(count=Count('pk'))
+        }
+        stored = {
+            (product_id, status): count
+            for product_id, status, count in ProductStock.objects.select_for_update()
+            .values_list('product_id', 'status', 'count')
+        }
+        drift = {
+            key: (stored.get(key, 0), actual.get(key, 0))
+            for key in set(actual) | set(stored)
+            if stored.get(key, 0) != actual.get(key, 0)
+        }
+        if drift:
+            ProductStock.objects.all().delete()
+            ProductStock.objects.bulk_create(
+                [ProductStock(product_id=p, status=s, count=c) for (p, s), c in actual.items()],
+                batch_size=1000,
+            )
+    return drift
@@ -1,3 +1,260 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from product.models import Product
+from request_units.signals import RequestItem
+
+from .lifecycle import transition
+from .serials import SequenceSerialAllocator, UlidSerialAllocator, allocate_serials, serial_prefix
+from .inventory import build_snapshots, stock_on
+from .models import InventorySnapshot, ProductStock, ProductUnit, ProductUnitStatusHistory
+from .stock import availability
+
+
+class ProductUnitLifecycleTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(code='U1', name='Куртка')
+        ProductUnit.objects.bulk_create([
+            ProductUnit(product=self.product, serial_number=f'U1-{i}', status=status)
+            for i, status in enumerate(['in_request', 'in_request', 'in_supply', 'sold'])
+        ])
+
+    def test_bulk_transition_counts_and_history(self):
+        result = transition(ProductUnit.objects.all(), 'in_store')
+        self.assertEqual((result.moved, result.rejected), (3, 1))
+        self.assertEqual(ProductUnit.objects.filter(status='in_store').count(), 3)
+        self.assertEqual(
+            sorted(ProductUnitStatusHistory.objects.exclude(from_status='').values_list('from_status', flat=True)),
+            ['in_request', 'in_request', 'in_supply']
+        )
+
+    def test_unknown_state(self):
+        with self.assertRaises(ValidationError):
+            transition(ProductUnit.objects.all(), 'teleported')
+
+    def test_single_unit_save_validates_and_records(self):
+        unit = ProductUnit.objects.get(serial_number='U1-3')
+        unit.status = 'in_request'
+        with self.assertRaises(ValidationError):
+            unit.clean()
+
+        unit.status = 'returned'
+        unit.clean()
+        unit.save()
+        self.assertEqual(unit.status_history.get(from_status='sold').to_status, 'returned')
+
+
+class SerialAllocatorTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(code='ab', name='Носки')
+
+    def test_sequence_blocks_do_not_overlap(self):
+        first = allocate_serials(self.product, 3)
+        second = allocate_serials(self.product, 2)
+        self.assertEqual(first, ['ab-00000001', 'ab-00000002', 'ab-00000003'])
+        self.assertEqual(second, ['ab-00000004', 'ab-00000005'])
+
+    def test_query_count_does_not_depend_on_block_size(self):
+        allocator = SequenceSerialAllocator()
+        allocator.allocate(self.product)
+        for count in (1, 1000):
+            with self.assertNumQueries(4):
+                serials = allocator.allocate(self.product, count)
+            self.assertEqual(len(set(serials)), count)
+
+    def test_codes_differing_in_case_do_not_collide(self):
+        upper = Product.objects.create(code='AB', name='Носки')
+        ProductUnit.objects.create(product=self.product)
+        ProductUnit.objects.create(product=upper)
+        self.assertEqual(
+            sorted(ProductUnit.objects.values_list('serial_number', flat=True)),
+            ['AB-00000001', 'ab-00000001'],
+        )
+
+    def test_fallback_prefix_cannot_match_a_code(self):
+        long_code = Product.objects.create(code='L' * 95, name='Шарф')
+        marked = Product.objects.create(code=f'#{long_code.pk}', name='Шарф')
+        like_old_fallback = Product.objects.create(code=f'P{long_code.pk}', name='Шарф')
+        self.assertEqual(serial_prefix(long_code, reserve=9), f'#{long_code.pk}')
+        self.assertEqual(serial_prefix(marked, reserve=9), f'#{marked.pk}')
+        self.assertEqual(serial_prefix(like_old_fallback, reserve=9), f'P{long_code.pk}')
+        serials = [allocate_serials(p)[0] for p in (long_code, marked, like_old_fallback)]
+        self.assertEqual(len(set(serials)), 3)
+
+    @override_settings(UNIT_SERIAL_ALLOCATOR='unit.serials.UlidSerialAllocator')
+    def test_ulid_allocator_is_monotonic_without_queries(self):
+        with self.assertNumQueries(0):
+            serials = allocate_serials(self.product, 500)
+        self.assertEqual(serials, sorted(serials))
+        self.assertEqual(len(set(serials)), 500)
+        self.assertTrue(all(len(s) == len('ab-') + UlidSerialAllocator.length for s in serials))
+
+
+class RequestItemUnitsTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(code='R1', name='Пальто')
+
+    def test_customer_order_creates_units_in_constant_queries(self):
+        # Первая позиция товара заводит его счетчики серийников и остатков
+        RequestItem.objects.create(product=self.product, quantity_ordered=1, is_customer_order=True)
+        queries = []
+        for quantity in (1, 40):
+            with CaptureQueriesContext(connection) as ctx:
+                item = RequestItem.objects.create(
+                    product=self.product, quantity_ordered=quantity, is_customer_order=True
+                )
+            queries.append(len(ctx.captured_queries))
+            units = ProductUnit.objects.filter(request_item=item)
+            self.assertEqual(units.count(), quantity)
+            self.assertEqual(set(units.values_list('status', flat=True)), {'in_request'})
+        # Число запросов не зависит от количества единиц в позиции
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(ProductUnit.objects.values('serial_number').distinct().count(), 42)
+        self.assertEqual(availability([self.product.pk])[self.product.pk], {'in_request': 42})
+
+    def test_stock_order_creates_no_units(self):
+        RequestItem.objects.create(product=self.product, quantity_ordered=5, is_customer_order=False)
+        self.assertFalse(ProductUnit.objects.exists())
+
+
+class ProductStockTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(code='S1', name='Шапка')
+        self.other = Product.objects.create(code='S2', name='Шарф')
+        ProductUnit.objects.bulk_create([
+            ProductUnit(product=self.product, serial_number=f'S1-{i}', status='in_supply')
+            for i in range(5)
+        ])
+
+    def counts(self, product):
+        return availability([product.pk])[product.pk]
+
+    def test_counters_follow_unit_changes(self):
+        self.assertEqual(self.counts(self.product), {'in_supply': 5})
+        transition(ProductUnit.objects.filter(serial_number__in=['S1-0', 'S1-1']), 'in_store')
+        self.assertEqual(self.counts(self.product), {'in_supply': 3, 'in_store': 2})
+        self.assertEqual(self.product.get_availability_status(), 'В наличии')
+
+        unit = ProductUnit.objects.get(serial_number='S1-0')
+        unit.status = 'sold'
+        unit.save()
+        ProductUnit.objects.filter(serial_number='S1-4').delete()
+        ProductUnit.objects.create(product=self.product, serial_number='S1-new', status='in_store')
+        self.assertEqual(self.counts(self.product), {'in_supply': 2, 'in_store': 2, 'sold': 1})
+        self.assertEqual(self.other.get_availability_status(), 'Нет в наличии')
+
+    def test_saves_without_loaded_status_read_the_stored_one(self):
+        unit = ProductUnit.objects.only('pk', 'serial_number', 'product').get(serial_number='S1-0')
+        unit.status = 'in_store'
+        unit.save()
+        pk = ProductUnit.objects.get(serial_number='S1-1').pk
+        ProductUnit(
+            pk=pk, product=self.product, serial_number='S1-1', status='in_store', created_at=timezone.now()
+        ).save()
+        self.assertEqual(self.counts(self.product), {'in_supply': 3, 'in_store': 2})
+        self.assertEqual(
+            ProductUnitStatusHistory.objects.filter(from_status='in_supply', to_status='in_store').count(), 2
+        )
+
+    def test_bulk_upsert_counts_only_inserted_and_changed_rows(self):
+        ProductUnit.objects.bulk_create(
+            [
+                ProductUnit(product=self.product, serial_number='S1-0', status='in_store'),
+                ProductUnit(product=self.product, serial_number='S1-1', status='in_supply'),
+                ProductUnit(product=self.other, serial_number='S2-0', status='in_store'),
+            ],
+            update_conflicts=True, unique_fields=['serial_number'], update_fields=['status'],
+        )
+        self.assertEqual(self.counts(self.product), {'in_supply': 4, 'in_store': 1})
+        self.assertEqual(self.counts(self.other), {'in_store': 1})
+        self.assertEqual(ProductUnit.objects.count(), 6)
+        self.assertEqual(
+            list(ProductUnitStatusHistory.objects.filter(unit__serial_number='S1-1').values_list('to_status', flat=True)),
+            ['in_supply'],
+        )
+        err = StringIO()
+        call_command('rebuild_stock', stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue(), '')
+
+    def test_bulk_create_rejects_ignore_conflicts(self):
+        with self.assertRaisesMessage(ValueError, 'ignore_conflicts'):
+            ProductUnit.objects.bulk_create(
+                [ProductUnit(product=self.product, serial_number='S1-9', status='in_store')],
+                ignore_conflicts=True,
+            )
+        self.assertFalse(ProductUnit.objects.filter(serial_number='S1-9').exists())
+
+    def test_availability_endpoint_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('product-availability'), {'products': f'{self.product.pk},{self.other.pk}'}
+            )
+        data = response.json()
+        self.assertFalse(data[str(self.product.pk)]['in_stock'])
+        self.assertEqual(data[str(self.other.pk)]['statuses'], {})
+
+    def test_rebuild_fixes_drift(self):
+        ProductStock.objects.filter(product=self.product).update(count=42)
+        err = StringIO()
+        call_command('rebuild_stock', stdout=StringIO(), stderr=err)
+        self.assertIn('42 -> 5', err.getvalue())
+        self.assertEqual(self.counts(self.product), {'in_supply': 5})
+
+
+class InventorySnapshotTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(code='H1', name='Перчатки')
+        self.today = timezone.localdate()
+        self.units = ProductUnit.objects.bulk_create([
+            ProductUnit(product=self.product, serial_number=f'H1-{i}', status='in_store')
+            for i in range(4)
+        ])
+        # Единицы "пришли" неделю назад, две проданы три дня назад
+        ProductUnitStatusHistory.objects.update(changed_at=self.at(7))
+        transition(ProductUnit.objects.filter(pk__in=[u.pk for u in self.units[:2]]), 'sold')
+        ProductUnitStatusHistory.objects.filter(to_status='sold').update(changed_at=self.at(3))
+
+    def at(self, days_ago):
+        day = self.today - timedelta(days=days_ago)
+        return timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=12)
+
+    def day(self, days_ago):
+        return self.today - timedelta(days=days_ago)
+
+    def test_point_in_time_without_snapshots(self):
+        pk = self.product.pk
+        self.assertEqual(stock_on(self.day(8), [pk]), {pk: {}})
+        self.assertEqual(stock_on(self.day(5), [pk]), {pk: {'in_store': 4}})
+        self.assertEqual(stock_on(self.day(1), [pk]), {pk: {'in_store': 2, 'sold': 2}})
+
+    def test_snapshots_and_bounded_replay(self):
+        build_snapshots(self.day(10), self.day(4))
+        self.assertEqual(
+            InventorySnapshot.objects.get(date=self.day(4), status='in_store').count, 4
+        )
+        self.assertFalse(InventorySnapshot.objects.filter(date=self.day(8)).exists())
+        with self.assertNumQueries(4):
+            stock = stock_on(self.day(2), [self.product.pk])
+        self.assertEqual(stock[self.product.pk], {'in_store': 2, 'sold': 2})
+
+    def test_unfinished_day_is_rejected(self):
+        with self.assertRaises(ValueError):
+            build_snapshots(self.day(3), self.today)
+        with self.assertRaises(CommandError):
+            call_command('build_inventory_snapshots', '--start', str(self.today), stdout=StringIO())
+        self.assertFalse(InventorySnapshot.objects.exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            'build_inventory_snapshots', '--start', str(self.day(3)), '--end', str(self.day(1)), stdout=out
+        )
+        self.assertIn('Saved 6 snapshot rows', out.getvalue())
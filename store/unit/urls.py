@@ -0,0 +1,7 @@
+#  app unit\urls
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('availability/', views.product_availability, name='product-availability'),
+]
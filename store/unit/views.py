@@ -1,3 +1,23 @@
-from django.shortcuts import render
+from django.http import JsonResponse
 
-# Create your views here.
+from .stock import availability
+
+MAX_AVAILABILITY_PRODUCTS = 500
+
+
+def product_availability(request):
+    """
+    Остатки для набора товаров одним запросом: ?products=1,2,3 ->
+    {"<id>": {"in_stock": bool, "statuses": {status: count}}}
+    """
+    try:
+        product_ids = [int(pk) for pk in request.GET.get('products', '').split(',') if pk.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'products - список id через запятую'}, status=400)
+    if len(product_ids) > MAX_AVAILABILITY_PRODUCTS:
+        return JsonResponse({'error': f'Не более {MAX_AVAILABILITY_PRODUCTS} товаров за запрос'}, status=400)
+
+    return JsonResponse({
+        str(product_id): {'in_stock': statuses.get('in_store', 0) > 0, 'statuses': statuses}
+        for product_id, statuses in availability(product_ids).items()
+    })